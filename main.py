@@ -22,6 +22,7 @@ def main_page():
             Page("pages/launch_bot/app.py", "Deploy", "🙌"),
             Section("Community Pages", "👨‍👩‍👧‍👦"),
             Page("pages/strategy_performance/app.py", "Strategy Performance", "🚀"),
+            Page("pages/fleet_performance/app.py", "Fleet Performance", "🛸"),
             Page("pages/db_inspector/app.py", "DB Inspector", "🔍"),
             Page("pages/token_spreads/app.py", "Token Spreads", "🧙"),
             Page("pages/tvl_vs_mcap/app.py", "TVL vs Market Cap", "🦉"),
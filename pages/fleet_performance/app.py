@@ -0,0 +1,52 @@
+import plotly.express as px
+import streamlit as st
+
+from utils.federated_database_manager import FederatedDatabaseManager
+from utils.os_utils import get_databases
+from utils.query_cache import get_db_fingerprint
+from utils.st_utils import initialize_st_page, download_csv_button, style_metric_cards
+
+
+initialize_st_page(title="Fleet Performance", icon="🛸")
+style_metric_cards()
+
+
+@st.cache_data(show_spinner="Loading the fleet summary...")
+def get_fleet_summary(databases: dict, fingerprints: tuple):
+    # The fingerprints are only part of the cache key, the summary is computed again when any database changes
+    return FederatedDatabaseManager(databases).get_fleet_summary()
+
+
+dbs = get_databases()
+if dbs is None:
+    st.warning("Ups! No databases were founded.")
+    st.stop()
+
+selected_sources = st.multiselect("Data sources", dbs.keys(), default=list(dbs.keys()))
+selected_databases = {source: dbs[source] for source in selected_sources}
+fleet_summary = get_fleet_summary(selected_databases,
+                                  tuple(get_db_fingerprint(db_path) for source_databases in selected_databases.values()
+                                        for db_path in source_databases.values()))
+if fleet_summary.empty:
+    st.warning("No trades found in the selected databases.")
+    st.stop()
+
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    st.metric(label="Net PnL", value=round(fleet_summary["net_realized_pnl"].sum(), 2),
+              help="The net realized profit or loss of every bot, in the quote asset of each market.")
+with col2:
+    st.metric(label="Volume", value=round(fleet_summary["volume"].sum(), 2))
+with col3:
+    st.metric(label="Fees", value=round(fleet_summary["fees"].sum(), 2))
+with col4:
+    st.metric(label="Total Trades", value=int(fleet_summary["total_trades"].sum()))
+
+bots_tab, markets_tab = st.tabs(["Bots", "Markets"])
+with bots_tab:
+    fleet_totals = fleet_summary.groupby("bot")[["total_trades", "volume", "fees", "net_realized_pnl"]].sum()
+    st.plotly_chart(px.bar(fleet_totals.reset_index(), x="bot", y="net_realized_pnl"), use_container_width=True)
+    st.dataframe(fleet_totals, use_container_width=True)
+with markets_tab:
+    st.dataframe(fleet_summary, use_container_width=True, hide_index=True)
+    download_csv_button(fleet_summary, "fleet_summary", "download-fleet-summary")
@@ -4,6 +4,9 @@ import streamlit as st
 import math
 from utils.os_utils import get_databases
 from utils.database_manager import DatabaseManager
+from utils.data_manipulation import MARKOUT_HORIZONS
+from utils.snapshot_cache import SnapshotCache
+from utils.pnl_methods import PNL_METHODS
 from utils.graphs import PerformanceGraphs
 from utils.st_utils import initialize_st_page, download_csv_button, style_metric_cards, db_error_message
 
@@ -25,6 +28,15 @@ intervals = {
     "1d": 60 * 60 * 24,
 }
 
+
+# Every manager holds the StrategyData it loaded, only the last databases viewed are kept so browsing the fleet
+# doesn't leave all of them in memory
+@st.cache_resource(max_entries=2)
+def get_database_manager(db_name: str):
+    # Kept across reruns so incremental loads can resume from the previous high-water marks
+    return DatabaseManager(db_name=db_name, snapshot_cache=SnapshotCache())
+
+
 # Data source section
 st.subheader("🔫 Data source")
 
@@ -44,14 +56,46 @@ if dbs is not None:
     bot_source = st.selectbox("Choose your database source:", dbs.keys())
     db_names = [x for x in dbs[bot_source]]
     selected_db_name = st.selectbox("Select a database to start:", db_names)
-    selected_db = DatabaseManager(db_name=dbs[bot_source][selected_db_name])
+    selected_db = get_database_manager(dbs[bot_source][selected_db_name])
 else:
     st.warning("Ups! No databases were founded. Start uploading one")
     selected_db = None
     st.stop()
 
+# Indexes are never created implicitly, building them locks the database for the writes of the bot
+missing_indexes = selected_db.get_missing_indexes()
+if missing_indexes:
+    with st.expander("🗂️ Indexes"):
+        live_db = selected_db.is_live()
+        st.caption(f"{', '.join(missing_indexes)} have no index, so the market and time filters scan the whole "
+                   f"table. Creating them modifies the database file and blocks its writers until they are built.")
+        if st.button("Create indexes", disabled=live_db,
+                     help="Disabled while the database is being written, stop the bot first." if live_db else None):
+            failed_tables = selected_db.create_indexes()
+            if failed_tables:
+                st.warning(f"Could not create the indexes of {', '.join(failed_tables)}, the database is locked or "
+                           f"read-only.")
+            else:
+                st.success("Indexes created.")
+
 # Load strategy data
-strategy_data = selected_db.get_strategy_data()
+live_mode = st.checkbox("Incremental refresh", value=False,
+                        help="Only read the rows written since the last load. Useful to follow a running bot.")
+compact_mode = st.checkbox("Compact memory", value=False,
+                           help="Keep the tables with categorical columns and float32 chart data. Useful for large "
+                                "databases.")
+# Only the columns used by the charts are read, the Tables section can load the rest for export
+strategy_data = selected_db.get_strategy_data(incremental=live_mode, concurrent=True, columns="charts",
+                                              compact=compact_mode, float32=compact_mode)
+st.caption("Loaded in " + ", ".join(f"{table_name}: {seconds:.2f}s"
+                                    for table_name, seconds in selected_db.load_timings.items()) +
+           f" | Memory: {sum(strategy_data.memory_usage.values()) / 1024 ** 2:.1f} MB" +
+           (f" compact, {sum(strategy_data.plain_memory_usage.values()) / 1024 ** 2:.1f} MB plain" if compact_mode
+            else ""))
+pnl_method = st.selectbox("Realized PnL method", PNL_METHODS.keys(), format_func=PNL_METHODS.get,
+                          help="Mark to last fill values the inventory at the last fill price. FIFO and Average cost "
+                               "match each fill against the open position, so only closing fills realize pnl.")
+strategy_data = strategy_data.get_strategy_data_by_pnl_method(pnl_method)
 main_performance_charts = PerformanceGraphs(strategy_data)
 
 # Strategy summary section
@@ -149,8 +193,13 @@ else:
         interval = st.selectbox("Candles Interval:", intervals.keys(), index=2)
         rows_per_page = st.number_input("Candles per Page", value=1500, min_value=1, max_value=5000)
 
+        # Candles of every interval are built once per market, the selected time range is a slice of them
+        candles = selected_db.get_market_data_candles_pyramid(selected_exchange, selected_trading_pair)[interval]
+        candles = candles.iloc[max(candles.index.searchsorted(start_time, side="right") - 1, 0):
+                               candles.index.searchsorted(end_time, side="right")]
+
         # Add pagination
-        total_rows = len(time_filtered_strategy_data.get_market_data_resampled(interval=f"{intervals[interval]}S"))
+        total_rows = len(candles)
         total_pages = math.ceil(total_rows / rows_per_page)
         if total_pages > 1:
             selected_page = st.select_slider("Select page", list(range(total_pages)), total_pages - 1, key="page_slider")
@@ -158,7 +207,7 @@ else:
             selected_page = 0
         start_idx = selected_page * rows_per_page
         end_idx = start_idx + rows_per_page
-        candles_df = time_filtered_strategy_data.get_market_data_resampled(interval=f"{intervals[interval]}S").iloc[start_idx:end_idx]
+        candles_df = candles.iloc[start_idx:end_idx]
         start_time_page = candles_df.index.min()
         end_time_page = candles_df.index.max()
 
@@ -168,7 +217,7 @@ else:
         candles_chart = page_performance_charts.candles_graph(candles_df, interval=interval)
 
         # Show auxiliary charts
-        intraday_tab, returns_tab, returns_data_tab, positions_tab, other_metrics_tab = st.tabs(["Intraday", "Returns", "Returns Data", "Positions", "Other Metrics"])
+        intraday_tab, returns_tab, returns_data_tab, equity_tab, markouts_tab, positions_tab, other_metrics_tab = st.tabs(["Intraday", "Returns", "Returns Data", "Equity", "Markouts", "Positions", "Other Metrics"])
         with intraday_tab:
             st.plotly_chart(time_filtered_performance_charts.intraday_performance(), use_container_width=True)
         with returns_tab:
@@ -180,6 +229,23 @@ else:
                          hide_index=True,
                          height=(min(len(time_filtered_strategy_data.trade_fill) * 39, 600)))
             download_csv_button(raw_returns_data, "raw_returns_data", "download-raw-returns")
+        with equity_tab:
+            # Marked at the mid price of every candle, so the pnl of the inventory held between fills is visible
+            st.plotly_chart(time_filtered_performance_charts.equity_curve(interval=f"{intervals[interval]}s"),
+                            use_container_width=True)
+        with markouts_tab:
+            markout_horizons = st.multiselect("Horizons", ["1s", "5s", "10s", "30s", "1min", "5min", "15min", "1h"],
+                                              default=MARKOUT_HORIZONS)
+            markouts_group_options = ["trade_type", "hour"] + \
+                (["level"] if "level" in time_filtered_strategy_data.trade_fill else [])
+            markouts_by = st.selectbox("Group by", markouts_group_options)
+            if markout_horizons:
+                # Ordered by horizon length so the lines read left to right
+                markout_horizons = sorted(markout_horizons, key=pd.Timedelta)
+                st.plotly_chart(time_filtered_performance_charts.markouts(markout_horizons, markouts_by),
+                                use_container_width=True)
+                st.dataframe(time_filtered_strategy_data.get_markouts_summary(markout_horizons, markouts_by),
+                             use_container_width=True, hide_index=True)
         with positions_tab:
             positions_sunburst = page_performance_charts.position_executor_summary_sunburst()
             if positions_sunburst:
@@ -217,6 +283,9 @@ else:
 # Tables section
 st.divider()
 st.subheader("Tables")
+if st.checkbox("Show all columns", value=False, help="Load every column of the tables, including the ones not used "
+                                                      "by the charts, to inspect or export them."):
+    strategy_data = selected_db.get_strategy_data(concurrent=True)
 with st.expander("💵 Trades"):
     st.write(strategy_data.trade_fill)
     download_csv_button(strategy_data.trade_fill, "trade_fill", "download-trades")
@@ -1,10 +1,21 @@
+import heapq
 from typing import Optional
 
 import numpy as np
 import pandas as pd
 
 
-def triple_barrier_method(df, tp=1.0, sl=1.0, tl=5, std_span: Optional[int] = 100, trade_cost=0.0006,  max_executors: int = 1):
+def triple_barrier_method(df, tp=1.0, sl=1.0, tl=5, std_span: Optional[int] = 100, trade_cost=0.0006,  max_executors: int = 1,
+                          price_mode: str = "close", tie_break: str = "sl",
+                          trailing_stop_activation_price_delta: float = 0.0, trailing_stop_trailing_delta: float = 0.0):
+    """
+    Label each signal of df (side != 0) with the first barrier it touches. In the default "close" price mode the
+    barriers are tested on the close of the bars. In the "high_low" mode take profit is tested on the high (long) or
+    low (short) and stop loss on the other extreme, so touches inside coarse candles are not missed. tie_break says
+    which one wins when both are touched in the same bar, and tp/sl closes return the barrier instead of the close.
+    A trailing stop is added when trailing_stop_trailing_delta > 0, its deltas are multipliers of the target as tp and
+    sl, and its closes have the "ts" close type.
+    """
     df.index = pd.to_datetime(df.timestamp, unit="ms")
     if std_span:
         df["target"] = df["close"].rolling(std_span).std() / df["close"]
@@ -13,9 +24,19 @@ def triple_barrier_method(df, tp=1.0, sl=1.0, tl=5, std_span: Optional[int] = 10
     df["tl"] = df.index + pd.Timedelta(seconds=tl)
     df.dropna(subset="target", inplace=True)
 
-    df = apply_tp_sl_on_tl(df, tp=tp, sl=sl)
+    df = apply_tp_sl_on_tl(df, tp=tp, sl=sl, price_mode=price_mode, tie_break=tie_break,
+                           trailing_stop_activation_price_delta=trailing_stop_activation_price_delta,
+                           trailing_stop_trailing_delta=trailing_stop_trailing_delta)
 
     df = get_bins(df, trade_cost)
+    if price_mode == "high_low":
+        # The barrier was crossed inside the bar, the close of the bar can be anywhere
+        touched = df["close_type"].isin(["tp", "sl"])
+        barrier_returns = df["target"] * np.where(df["close_type"] == "tp", tp, -sl)
+        df["ret"] = df["ret"].mask(touched, barrier_returns)
+        if "trailing_stop_trigger" in df:
+            df["ret"] = df["ret"].mask(df["close_type"] == "ts", df["trailing_stop_trigger"])
+        df["real_class"] = np.sign(df["ret"] - trade_cost)
 
     df['tp'] = df['close'] * (1 + df['target'] * tp * df["side"])
     df['sl'] = df['close'] * (1 - df['target'] * sl * df["side"])
@@ -25,15 +46,23 @@ def triple_barrier_method(df, tp=1.0, sl=1.0, tl=5, std_span: Optional[int] = 10
 
 
 def add_active_signals(df, max_executors):
-    close_times = [pd.Timestamp.min] * max_executors
-    df["active_signal"] = 0
-    for index, row in df[(df["side"] != 0)].iterrows():
-        for close_time in close_times:
-            if row["timestamp"] > close_time:
-                df.loc[df.index == index, "active_signal"] = 1
-                close_times.remove(close_time)
-                close_times.append(row["close_time"])
-                break
+    """
+    Mark with active_signal the signals that would be executed when at most max_executors can be open at once. A
+    signal is taken when an executor closed before its bar, the close times of the open executors are kept in a
+    min-heap so each signal costs O(log max_executors).
+    """
+    signal_positions = np.flatnonzero((df["side"] != 0).to_numpy())
+    signal_times = df.index.to_numpy().astype("datetime64[ns]").view("int64")[signal_positions]
+    close_times = df["close_time"].to_numpy().astype("datetime64[ns]").view("int64")[signal_positions]
+    active_signal = np.zeros(len(df), dtype=int)
+    executors_close_times = [np.iinfo(np.int64).min] * max_executors
+    if max_executors > 0:
+        for position, signal_time, close_time in zip(signal_positions.tolist(), signal_times.tolist(),
+                                                     close_times.tolist()):
+            if signal_time > executors_close_times[0]:
+                heapq.heapreplace(executors_close_times, close_time)
+                active_signal[position] = 1
+    df["active_signal"] = active_signal
     return df
 
 
@@ -48,23 +77,237 @@ def get_bins(df, trade_cost):
     return df
 
 
-def apply_tp_sl_on_tl(df: pd.DataFrame, tp: float, sl: float):
-    events = df[df["side"] != 0].copy()
+def _iter_path_returns(close: np.ndarray, starts: np.ndarray, ends: np.ndarray, sides: np.ndarray,
+                       high: np.ndarray = None, low: np.ndarray = None, max_window_cells: int = 2 ** 22):
+    """
+    Path returns, (price / close[start] - 1) * side, of the event windows close[start:end + 1] by chunks of events
+    holding at most max_window_cells prices. Yields the chunk and the returns to test against the upper and lower
+    barriers, NaN outside the windows. Both are the close returns, or with high and low the favorable and adverse
+    extremes of the bars, without the event bar since its range happened before the entry at its close.
+    """
+    intrabar = high is not None and low is not None
+    lengths = ends - starts + 1
+    width = int(lengths.max())
+    # Padded so that the windows of the last bars have the same width, the padding is outside every window
+    padding = np.full(width - 1, np.nan)
+    windows = [np.lib.stride_tricks.sliding_window_view(np.concatenate([prices, padding]), width)
+               for prices in ([high, low] if intrabar else [close])]
+    offsets = np.arange(width)
+    first_offset = 1 if intrabar else 0
+    chunk_size = max(1, max_window_cells // (width * len(windows)))
+    for chunk_start in range(0, len(starts), chunk_size):
+        chunk = slice(chunk_start, chunk_start + chunk_size)
+        chunk_starts = starts[chunk]
+        chunk_sides = sides[chunk, None]
+        outside = (offsets >= lengths[chunk, None]) | (offsets < first_offset)
+        path_returns = []
+        for price_windows in windows:
+            returns = (price_windows[chunk_starts] / close[chunk_starts, None] - 1) * chunk_sides
+            returns[outside] = np.nan
+            path_returns.append(returns)
+        if intrabar:
+            yield (chunk, np.where(chunk_sides > 0, path_returns[0], path_returns[1]),
+                   np.where(chunk_sides > 0, path_returns[1], path_returns[0]))
+        else:
+            yield chunk, path_returns[0], path_returns[0]
+
+
+def get_first_barrier_touches(close: np.ndarray, starts: np.ndarray, ends: np.ndarray, sides: np.ndarray,
+                              take_profit: np.ndarray, stop_loss: np.ndarray, high: np.ndarray = None,
+                              low: np.ndarray = None, max_window_cells: int = 2 ** 22):
+    """
+    Position of the first bar of each event window close[start:end + 1] whose path return, (close / close[start] - 1)
+    * side, is above take_profit and of the first one below stop_loss, -1 when the barrier is not touched. NaN
+    barriers are never touched. take_profit and stop_loss have one barrier per event, or one column per barrier
+    to test on the same windows. The windows of a chunk of events are compared at once as a 2-D array, chunks are
+    sized so that they hold at most max_window_cells prices.
+    When high and low are given, take_profit is tested on the high of the bars for long events and on the low for
+    short ones, stop_loss on the other extreme, and the event bar is left out since its range happened before the
+    entry at its close.
+    """
+    take_profit = np.asarray(take_profit, dtype=float)
+    stop_loss = np.asarray(stop_loss, dtype=float)
+    barriers = [np.atleast_2d(take_profit.T).T, np.atleast_2d(stop_loss.T).T]
+    positions = [np.full(barrier.shape, -1) for barrier in barriers]
+    if len(starts) > 0:
+        for chunk, upper_returns, lower_returns in _iter_path_returns(close, starts, ends, sides, high, low,
+                                                                      max_window_cells):
+            for barrier, barrier_positions, is_upper in zip(barriers, positions, [True, False]):
+                for i in range(barrier.shape[1]):
+                    touches = upper_returns > barrier[chunk, i, None] if is_upper \
+                        else lower_returns < barrier[chunk, i, None]
+                    barrier_positions[chunk, i] = np.where(touches.any(axis=1), starts[chunk] + touches.argmax(axis=1),
+                                                           -1)
+    return positions[0].reshape(take_profit.shape), positions[1].reshape(stop_loss.shape)
+
+
+def get_trailing_stop_touches(close: np.ndarray, starts: np.ndarray, ends: np.ndarray, sides: np.ndarray,
+                              activation_price_delta: np.ndarray, trailing_delta: np.ndarray, high: np.ndarray = None,
+                              low: np.ndarray = None, max_window_cells: int = 2 ** 22):
+    """
+    Position of the bar where the trailing stop of each event window closes, -1 when it doesn't, and the path return
+    of its trigger. As the executors' TrailingStop, the stop activates once the path return is above
+    activation_price_delta and closes when it drops trailing_delta below its highest value since then. The highest
+    value is a running maximum scan of each window and a bar is tested against the maximum of the bars before it.
+    The deltas have one value per event, or one column per trailing stop to test on the same windows. high and low
+    work as in get_first_barrier_touches.
+    """
+    activation_price_delta = np.asarray(activation_price_delta, dtype=float)
+    trailing_delta = np.atleast_2d(np.asarray(trailing_delta, dtype=float).T).T
+    activations = np.atleast_2d(activation_price_delta.T).T
+    positions = np.full(activations.shape, -1)
+    triggers = np.full(activations.shape, np.nan)
+    if len(starts) > 0:
+        for chunk, upper_returns, lower_returns in _iter_path_returns(close, starts, ends, sides, high, low,
+                                                                      max_window_cells):
+            previous_max = np.full(upper_returns.shape, np.nan)
+            previous_max[:, 1:] = np.fmax.accumulate(upper_returns[:, :-1], axis=1)
+            rows = np.arange(len(previous_max))
+            for i in range(activations.shape[1]):
+                trigger = previous_max - trailing_delta[chunk, i, None]
+                touches = (previous_max > activations[chunk, i, None]) & (lower_returns < trigger)
+                first_touches = touches.argmax(axis=1)
+                touched = touches[rows, first_touches]
+                positions[chunk, i] = np.where(touched, starts[chunk] + first_touches, -1)
+                triggers[chunk, i] = np.where(touched, trigger[rows, first_touches], np.nan)
+    return positions.reshape(activation_price_delta.shape), triggers.reshape(activation_price_delta.shape)
+
+
+def _get_intrabar_prices(df: pd.DataFrame, price_mode: str, tie_break: str):
+    """
+    Keyword arguments of get_first_barrier_touches for the price mode, the high and low prices in the "high_low"
+    mode and none in the "close" one.
+    """
+    if price_mode not in ["close", "high_low"]:
+        raise ValueError(f"Unknown price mode {price_mode}, use close or high_low")
+    if tie_break not in ["tp", "sl"]:
+        raise ValueError(f"Unknown tie break {tie_break}, use tp or sl")
+    if price_mode == "close":
+        return {}
+    return {"high": df["high"].to_numpy(dtype=float), "low": df["low"].to_numpy(dtype=float)}
+
+
+def apply_tp_sl_on_tl(df: pd.DataFrame, tp: float, sl: float, price_mode: str = "close", tie_break: str = "sl",
+                      trailing_stop_activation_price_delta: float = 0.0, trailing_stop_trailing_delta: float = 0.0):
+    intrabar_prices = _get_intrabar_prices(df, price_mode, tie_break)
+    events = df[df["side"] != 0]
     if tp > 0:
         take_profit = tp * events['target']
     else:
-        take_profit = pd.Series(index=df.index)  # NaNs
+        take_profit = pd.Series(np.nan, index=events.index)
     if sl > 0:
         stop_loss = - sl * events['target']
     else:
-        stop_loss = pd.Series(index=df.index)  # NaNs
-
-    for loc, tl in events['tl'].fillna(df.index[-1]).items():
-        df0 = df.close[loc:tl]  # path prices
-        df0 = (df0 / df.close[loc] - 1) * events.at[loc, 'side']  # path returns
-        df.loc[loc, 'stop_loss_time'] = df0[df0 < stop_loss[loc]].index.min()  # earliest stop loss.
-        df.loc[loc, 'take_profit_time'] = df0[df0 > take_profit[loc]].index.min()  # earliest profit taking.
-    df["close_time"] = df[["tl", "take_profit_time", "stop_loss_time"]].dropna(how='all').min(axis=1)
-    df['close_type'] = df[['take_profit_time', 'stop_loss_time', 'tl']].dropna(how='all').idxmin(axis=1)
-    df['close_type'].replace({'take_profit_time': 'tp', 'stop_loss_time': 'sl'}, inplace=True)
+        stop_loss = pd.Series(np.nan, index=events.index)
+
+    # Each event window goes from the event bar to the last bar at or before its time limit
+    starts = np.flatnonzero((df["side"] != 0).to_numpy())
+    ends = df.index.searchsorted(events['tl'].fillna(df.index[-1]), side="right") - 1
+    take_profit_positions, stop_loss_positions = get_first_barrier_touches(
+        df["close"].to_numpy(dtype=float), starts, ends, events["side"].to_numpy(dtype=float),
+        take_profit.to_numpy(dtype=float), stop_loss.to_numpy(dtype=float), **intrabar_prices)
+    touch_positions = [("stop_loss_time", stop_loss_positions)]
+    if trailing_stop_trailing_delta > 0:
+        # The deltas are multipliers of the target, as tp and sl
+        trailing_stop_positions, trailing_stop_triggers = get_trailing_stop_touches(
+            df["close"].to_numpy(dtype=float), starts, ends, events["side"].to_numpy(dtype=float),
+            trailing_stop_activation_price_delta * events["target"].to_numpy(dtype=float),
+            trailing_stop_trailing_delta * events["target"].to_numpy(dtype=float), **intrabar_prices)
+        touch_positions.append(("trailing_stop_time", trailing_stop_positions))
+        df["trailing_stop_trigger"] = np.nan
+        df.iloc[starts, df.columns.get_loc("trailing_stop_trigger")] = trailing_stop_triggers
+    if tie_break == "sl":
+        # Ties can only happen with intrabar prices, the close of a bar can't be above tp and below a stop
+        for _, positions in touch_positions:
+            take_profit_positions = np.where(take_profit_positions == positions, -1, take_profit_positions)
+    touch_positions.append(("take_profit_time", take_profit_positions))
+    timestamps = df.index.to_numpy()
+    for column, positions in touch_positions:
+        touch_times = np.full(len(df), np.datetime64("NaT"), dtype="datetime64[ns]")
+        touch_times[starts] = np.where(positions >= 0, timestamps[positions.clip(0)], np.datetime64("NaT"))
+        df[column] = touch_times
+    stop_columns = [column for column, _ in touch_positions[:-1]]
+    df["close_time"] = df[["tl", "take_profit_time"] + stop_columns].dropna(how='all').min(axis=1)
+    df['close_type'] = df[['take_profit_time'] + stop_columns + ['tl']].dropna(how='all').idxmin(axis=1)
+    df['close_type'].replace({'take_profit_time': 'tp', 'stop_loss_time': 'sl', 'trailing_stop_time': 'ts'},
+                             inplace=True)
     return df
+
+
+def triple_barrier_grid(df, combinations, std_span: Optional[int] = 100, trade_cost=0.0006, price_mode: str = "close",
+                        tie_break: str = "sl"):
+    """
+    Label the events of df (rows with side != 0) for every (tp, sl, tl) row of combinations, or (tp, sl, tl,
+    trailing_stop_activation_price_delta, trailing_stop_trailing_delta) row with trailing stops, with the same rules
+    as triple_barrier_method. The path returns of each event are computed once for the longest time limit and every
+    take profit, stop loss and trailing stop value is tested on them, so a grid costs about one labeling per distinct
+    value instead of one per combination. price_mode and tie_break work as in triple_barrier_method.
+    Returns a dict with the event timestamps ("events") and (combination, event) arrays of "close_time",
+    "close_type" ("tp", "sl", "ts" or "tl"), "ret" and "real_class".
+    """
+    combinations = np.asarray(combinations, dtype=float)
+    combinations = combinations.reshape(-1, combinations.shape[-1])
+    if combinations.shape[1] == 3:
+        combinations = np.column_stack([combinations, np.zeros((len(combinations), 2))])
+    df = df.copy()
+    df.index = pd.to_datetime(df.timestamp, unit="ms")
+    if std_span:
+        df["target"] = df["close"].rolling(std_span).std() / df["close"]
+    else:
+        df["target"] = 1 / 100
+    df.dropna(subset="target", inplace=True)
+    intrabar_prices = _get_intrabar_prices(df, price_mode, tie_break)
+    events = df[df["side"] != 0]
+    starts = np.flatnonzero((df["side"] != 0).to_numpy())
+    close = df["close"].to_numpy(dtype=float)
+    sides = events["side"].to_numpy(dtype=float)
+    target = events["target"].to_numpy(dtype=float)
+    timestamps = df.index.to_numpy()
+
+    # Last bar of each event window for every time limit, the windows are built for the longest one. Time limits are
+    # converted in nanoseconds like pd.Timedelta(seconds=tl), fractions of a second included
+    time_limits = events.index.to_numpy()[None, :] + (combinations[:, 2, None] * 1e9).astype("timedelta64[ns]")
+    ends = np.stack([df.index.searchsorted(time_limit, side="right") - 1 for time_limit in time_limits])
+    take_profits = np.unique(combinations[:, 0])
+    stop_losses = np.unique(combinations[:, 1])
+    take_profit_barriers = np.where(take_profits > 0, take_profits[None, :] * target[:, None], np.nan)
+    stop_loss_barriers = np.where(stop_losses > 0, - stop_losses[None, :] * target[:, None], np.nan)
+    take_profit_positions, stop_loss_positions = get_first_barrier_touches(
+        close, starts, ends.max(axis=0), sides, take_profit_barriers, stop_loss_barriers, **intrabar_prices)
+    trailing_stops, trailing_stop_indices = np.unique(combinations[:, 3:], axis=0, return_inverse=True)
+    trailing_stop_positions, trailing_stop_triggers = get_trailing_stop_touches(
+        close, starts, ends.max(axis=0), sides, trailing_stops[None, :, 0] * target[:, None],
+        np.where(trailing_stops[None, :, 1] > 0, trailing_stops[None, :, 1] * target[:, None], np.nan),
+        **intrabar_prices)
+
+    # A touch only counts if it happens before the time limit of the combination. Ties go to tp, sl and ts in this
+    # order, or to the stops first when tie_break is "sl"
+    no_touch = np.iinfo(np.int64).max
+    take_profit_positions = take_profit_positions.T[np.searchsorted(take_profits, combinations[:, 0])]
+    stop_loss_positions = stop_loss_positions.T[np.searchsorted(stop_losses, combinations[:, 1])]
+    trailing_stop_positions = trailing_stop_positions.T[trailing_stop_indices.ravel()]
+    trailing_stop_triggers = trailing_stop_triggers.T[trailing_stop_indices.ravel()]
+    take_profit_positions, stop_loss_positions, trailing_stop_positions = [
+        np.where((positions >= 0) & (positions <= ends), positions, no_touch)
+        for positions in [take_profit_positions, stop_loss_positions, trailing_stop_positions]]
+    stop_positions = np.minimum(stop_loss_positions, trailing_stop_positions)
+    is_take_profit = (take_profit_positions != no_touch) & (
+        (take_profit_positions < stop_positions) if tie_break == "sl" else (take_profit_positions <= stop_positions))
+    is_stop_loss = ~is_take_profit & (stop_loss_positions != no_touch) & (
+        stop_loss_positions <= trailing_stop_positions)
+    is_trailing_stop = ~is_take_profit & ~is_stop_loss & (trailing_stop_positions != no_touch)
+    close_positions = np.where(is_take_profit, take_profit_positions,
+                               np.where(is_stop_loss | is_trailing_stop, stop_positions, ends))
+    close_time = np.where(is_take_profit | is_stop_loss | is_trailing_stop,
+                          timestamps[close_positions.clip(0, len(timestamps) - 1)], time_limits)
+    close_type = np.where(is_take_profit, "tp", np.where(is_stop_loss, "sl", np.where(is_trailing_stop, "ts", "tl")))
+    ret = (close[close_positions.clip(0, len(close) - 1)] / close[starts][None, :] - 1) * sides[None, :]
+    if price_mode == "high_low":
+        ret = np.where(is_take_profit, combinations[:, 0, None] * target[None, :], ret)
+        ret = np.where(is_stop_loss, - combinations[:, 1, None] * target[None, :], ret)
+        ret = np.where(is_trailing_stop, trailing_stop_triggers, ret)
+    return {"events": events.index,
+            "close_time": close_time,
+            "close_type": close_type,
+            "ret": ret,
+            "real_class": np.sign(ret - trade_cost)}
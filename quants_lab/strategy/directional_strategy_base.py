@@ -64,7 +64,8 @@ class DirectionalStrategyBase(Generic[ConfigType]):
                         take_profit_multiplier, stop_loss_multiplier, time_limit,
                         std_span, order_amount=100, leverage=20, initial_portfolio=1000,
                         taker_fee=0.0003, maker_fee=0.00012,
-                        start: Optional[str] = None, end: Optional[str] = None):
+                        start: Optional[str] = None, end: Optional[str] = None,
+                        trailing_stop_activation_price_delta=0.0, trailing_stop_trailing_delta=0.0):
         df = self.get_data(start=start, end=end)
         df = self.preprocessing(df)
         df = self.predict(df)
@@ -76,6 +77,8 @@ class DirectionalStrategyBase(Generic[ConfigType]):
             tl=time_limit,
             trade_cost=taker_fee * 2,
             max_executors=1,
+            trailing_stop_activation_price_delta=trailing_stop_activation_price_delta,
+            trailing_stop_trailing_delta=trailing_stop_trailing_delta,
         )
 
         first_row = df.iloc[0].tolist()
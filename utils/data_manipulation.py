@@ -1,8 +1,41 @@
 import datetime
+import sys
 from dataclasses import dataclass
+from functools import cached_property
 import pandas as pd
 import numpy as np
 
+from utils.pnl_methods import apply_pnl_method
+
+
+def set_union_categories(columns):
+    """
+    Set every (table, column) categorical of columns to the union of their categories, in place and in order of first
+    appearance, so they can be concatenated or joined as categoricals. Categories are only appended, the strings are
+    not copied. Returns the shared dtype.
+    """
+    categories = None
+    for table, column in columns:
+        column_categories = table[column].cat.categories
+        categories = column_categories if categories is None \
+            else categories.append(column_categories[~column_categories.isin(categories)])
+    dtype = pd.CategoricalDtype(categories)
+    for table, column in columns:
+        if table[column].dtype != dtype:
+            table[column] = table[column].cat.set_categories(categories)
+    return dtype
+
+
+def concat_tables(tables, **kwargs):
+    """
+    pd.concat of tables that keeps their categorical columns categorical. pandas falls back to object when the
+    categories differ, so they are first set to their union, which modifies the tables in place.
+    """
+    for column in tables[0].columns:
+        if all(column in table and isinstance(table[column].dtype, pd.CategoricalDtype) for table in tables):
+            set_union_categories([(table, column) for table in tables])
+    return pd.concat(tables, **kwargs)
+
 
 @dataclass
 class StrategyData:
@@ -11,6 +44,152 @@ class StrategyData:
     trade_fill: pd.DataFrame
     market_data: pd.DataFrame = None
     position_executor: pd.DataFrame = None
+    # One of the pnl_methods.PNL_METHODS conventions, the one the realized pnl columns of trade_fill follow
+    pnl_method: str = "mark_to_fill"
+
+    # Low cardinality text columns of each table, stored as categoricals when loaded in compact mode
+    CATEGORICAL_COLUMNS = {
+        "orders": ["config_file_path", "strategy", "market", "symbol", "base_asset", "quote_asset", "order_type",
+                   "last_status", "position"],
+        "trade_fill": ["config_file_path", "strategy", "market", "symbol", "base_asset", "quote_asset", "order_type",
+                       "trade_type", "position"],
+        "order_status": ["status"],
+        "market_data": ["exchange", "trading_pair"],
+        "position_executor": ["exchange", "trading_pair", "side", "close_type", "controller_name", "order_level",
+                              "level", "executor_status", "open_order_type"],
+    }
+    # Order id columns, stored in compact mode as categoricals sharing one set of categories
+    ORDER_ID_COLUMNS = {"orders": "id", "trade_fill": "order_id", "order_status": "order_id"}
+    # Columns only drawn by the charts, where float32 precision is enough, stored as float32 on request
+    FLOAT32_COLUMNS = {
+        "trade_fill": ["inventory_cost", "quote_volume"],
+        "market_data": ["mid_price", "best_bid", "best_ask"],
+    }
+
+    def __post_init__(self):
+        # The market partitions are built on the first call of get_single_market_strategy_data
+        self._markets, self._market_partitions = None, None
+        self._single_market_strategy_data = {}
+        self._pnl_method_strategy_data = {}
+
+    @staticmethod
+    def _get_partition_positions(market_codes, timestamps=None):
+        """
+        Row positions of every market code, each sorted by time. All the partitions are slices of one array built
+        with two stable sorts, rows without a market (code -1) are left out.
+        """
+        market_codes = np.asarray(market_codes)
+        positions = np.argsort(np.asarray(timestamps), kind="stable") if timestamps is not None \
+            else np.arange(len(market_codes))
+        positions = positions[np.argsort(market_codes[positions], kind="stable")]
+        sorted_codes = market_codes[positions]
+        unique_codes, starts = np.unique(sorted_codes, return_index=True)
+        ends = np.append(starts[1:], len(sorted_codes))
+        return {code: positions[start:end] for code, start, end in zip(unique_codes, starts, ends) if code >= 0}
+
+    def _get_market_partitions(self):
+        """
+        Row positions of each (exchange, trading_pair) in every table, built once so switching markets doesn't scan
+        the tables again. Trade fills and order status follow the market of their order.
+        """
+        market_columns = {"orders": ("market", "symbol"),
+                          "market_data": ("exchange", "trading_pair"),
+                          "position_executor": ("exchange", "trading_pair")}
+        table_keys = {table_name: pd.MultiIndex.from_arrays([getattr(self, table_name)[column] for column in columns])
+                      for table_name, columns in market_columns.items() if getattr(self, table_name) is not None}
+        markets = pd.MultiIndex.from_arrays([[], []])
+        for keys in table_keys.values():
+            markets = markets.union(keys.unique())
+        market_codes = {table_name: markets.get_indexer(keys) for table_name, keys in table_keys.items()}
+
+        partitions = {table_name: {} for table_name in ["orders", "trade_fill", "order_status", "market_data",
+                                                        "position_executor"]}
+        if self.orders is not None:
+            partitions["orders"] = self._get_partition_positions(market_codes["orders"],
+                                                                 self.orders.get("creation_timestamp"))
+            order_codes = pd.Series(market_codes["orders"], index=self.orders["id"].values)
+            order_codes = order_codes[~order_codes.index.duplicated()]
+            for table_name in ["trade_fill", "order_status"]:
+                table = getattr(self, table_name)
+                if table is not None:
+                    codes = table["order_id"].map(order_codes).fillna(-1).astype(int)
+                    partitions[table_name] = self._get_partition_positions(codes, table.get("timestamp"))
+        if self.market_data is not None:
+            partitions["market_data"] = self._get_partition_positions(market_codes["market_data"],
+                                                                      self.market_data.index)
+        if self.position_executor is not None:
+            partitions["position_executor"] = self._get_partition_positions(market_codes["position_executor"],
+                                                                            self.position_executor.get("datetime"))
+        return markets, partitions
+
+    def _get_market_partition(self, table_name, market_code):
+        table = getattr(self, table_name)
+        if table is None:
+            return None
+        positions = self._market_partitions[table_name].get(market_code, np.array([], dtype=int))
+        return table.iloc[positions]
+
+    @cached_property
+    def memory_usage(self):
+        """
+        Bytes used by each table, including the strings of object columns. Measuring object columns reads every
+        string, so it is computed once per StrategyData.
+        """
+        return {table_name: int(getattr(self, table_name).memory_usage(index=True, deep=True).sum())
+                for table_name in ["orders", "order_status", "trade_fill", "market_data", "position_executor"]
+                if getattr(self, table_name) is not None}
+
+    @staticmethod
+    def _get_plain_memory_usage(table: pd.DataFrame):
+        """
+        Bytes the table would use with its categoricals as object columns and its float32 columns as float64, counted
+        as memory_usage(deep=True) does, from the category sizes and counts instead of materializing the strings.
+        """
+        plain_bytes = int(table.index.memory_usage(deep=True))
+        for _, values in table.items():
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                category_sizes = np.array([sys.getsizeof(category) for category in values.cat.categories], dtype=int)
+                codes = values.cat.codes.to_numpy()
+                counts = np.bincount(codes[codes >= 0], minlength=len(category_sizes))
+                plain_bytes += 8 * len(values) + int(counts @ category_sizes) + \
+                    sys.getsizeof(np.nan) * int((codes < 0).sum())
+            elif values.dtype == np.float32:
+                plain_bytes += 8 * len(values)
+            else:
+                plain_bytes += int(values.memory_usage(index=False, deep=True))
+        return plain_bytes
+
+    @cached_property
+    def plain_memory_usage(self):
+        """Bytes each table would use without the categoricals and float32 columns of the compact mode."""
+        return {table_name: self._get_plain_memory_usage(getattr(self, table_name))
+                for table_name in ["orders", "order_status", "trade_fill", "market_data", "position_executor"]
+                if getattr(self, table_name) is not None}
+
+    def share_order_id_categories(self):
+        """Set the categorical ORDER_ID_COLUMNS of the tables to one set of categories, in place."""
+        order_id_columns = [(getattr(self, table_name), column) for table_name, column in self.ORDER_ID_COLUMNS.items()
+                            if getattr(self, table_name) is not None and column in getattr(self, table_name) and
+                            isinstance(getattr(self, table_name)[column].dtype, pd.CategoricalDtype)]
+        if len(order_id_columns) > 0:
+            set_union_categories(order_id_columns)
+
+    def get_strategy_data_by_pnl_method(self, pnl_method: str):
+        """
+        Copy of the StrategyData whose trade fills realize pnl with one of the pnl_methods.PNL_METHODS conventions.
+        The copy is kept for the next call with the same method, since matching the lots goes over every fill.
+        """
+        if self.trade_fill is None or pnl_method == self.pnl_method:
+            return self
+        if pnl_method not in self._pnl_method_strategy_data:
+            self._pnl_method_strategy_data[pnl_method] = StrategyData(
+                orders=self.orders,
+                order_status=self.order_status,
+                trade_fill=apply_pnl_method(self.trade_fill, pnl_method),
+                market_data=self.market_data,
+                position_executor=self.position_executor,
+                pnl_method=pnl_method)
+        return self._pnl_method_strategy_data[pnl_method]
 
     @property
     def strategy_summary(self):
@@ -19,7 +198,41 @@ class StrategyData:
         else:
             return None
 
-    def get_strategy_summary(self):
+    @staticmethod
+    def _get_sparklines(values, group_codes, max_points=100):
+        """
+        Reduce the values of each group to at most max_points, in their original order. Groups longer than that are
+        split in equal buckets and only the minimum and maximum of each bucket, plus the first and last value of the
+        group, are kept, so the peaks and drawdowns of the series survive the decimation.
+        """
+        values = np.asarray(values, dtype=float)
+        group_codes = np.asarray(group_codes)
+        if len(values) == 0:
+            return {}
+        positions = np.argsort(group_codes, kind="stable")
+        sorted_codes = group_codes[positions]
+        unique_codes, starts, counts = np.unique(sorted_codes, return_index=True, return_counts=True)
+        group_lengths = np.repeat(counts, counts)
+        position_in_group = np.arange(len(positions)) - np.repeat(starts, counts)
+        n_buckets = max((max_points - 2) // 2, 1)
+        is_long = group_lengths > max_points
+        buckets = np.where(is_long, position_in_group * n_buckets // np.maximum(group_lengths, 1), position_in_group)
+        buckets = sorted_codes.astype(np.int64) * (max_points + 1) + buckets
+        # The first and last rows of each bucket sorted by value are its minimum and maximum
+        by_value = np.lexsort((values[positions], buckets))
+        bucket_starts = np.flatnonzero(np.r_[True, buckets[by_value][1:] != buckets[by_value][:-1]])
+        bucket_ends = np.r_[bucket_starts[1:], len(by_value)] - 1
+        kept = np.zeros(len(positions), dtype=bool)
+        kept[by_value[bucket_starts]] = True
+        kept[by_value[bucket_ends]] = True
+        kept[starts] = True
+        kept[starts + counts - 1] = True
+        kept_values = values[positions][kept]
+        kept_codes = sorted_codes[kept]
+        splits = np.flatnonzero(kept_codes[1:] != kept_codes[:-1]) + 1
+        return {code: list(series) for code, series in zip(unique_codes, np.split(kept_values, splits))}
+
+    def get_strategy_summary(self, sparkline_points: int = 100):
         columns_dict = {"strategy": "Strategy",
                         "market": "Exchange",
                         "symbol": "Trading Pair",
@@ -30,26 +243,26 @@ class StrategyData:
                         "STOP_LOSS": "# SL",
                         "TRAILING_STOP": "# TSL",
                         "TIME_LIMIT": "# TL",
-                        "net_realized_pnl_full_series": "PnL Over Time",
+                        "net_realized_pnl_sparkline": "PnL Over Time",
                         "net_realized_pnl_last": "Realized PnL"}
 
-        def full_series(series):
-            return list(series)
-
         # Get trade fill data
         trade_fill_data = self.trade_fill.copy()
         trade_fill_data["volume"] = trade_fill_data["amount"] * trade_fill_data["price"]
-        grouped_trade_fill = trade_fill_data.groupby(["strategy", "market", "symbol"]
-                                                     ).agg({"order_id": "count",
-                                                            "volume": "sum",
-                                                            "net_realized_pnl": [full_series,
-                                                                                 "last"]}).reset_index()
-        grouped_trade_fill.columns = [f"{col[0]}_{col[1]}" if len(col[1]) > 0 else col[0] for col in grouped_trade_fill.columns]
+        trade_fill_groups = trade_fill_data.groupby(["strategy", "market", "symbol"], observed=True)
+        grouped_trade_fill = trade_fill_groups.agg(order_id_count=("order_id", "count"),
+                                                   volume_sum=("volume", "sum"),
+                                                   net_realized_pnl_last=("net_realized_pnl", "last")).reset_index()
+        # The PnL Over Time line chart only needs the shape of the series, not every fill
+        sparklines = self._get_sparklines(trade_fill_data["net_realized_pnl"], trade_fill_groups.ngroup(),
+                                          sparkline_points)
+        grouped_trade_fill["net_realized_pnl_sparkline"] = [sparklines.get(code, [])
+                                                            for code in range(len(grouped_trade_fill))]
 
         # Get position executor data
         if self.position_executor is not None:
             position_executor_data = self.position_executor.copy()
-            grouped_executors = position_executor_data.groupby(["exchange", "trading_pair", "controller_name", "close_type"]).agg(metric_count=("close_type", "count")).reset_index()
+            grouped_executors = position_executor_data.groupby(["exchange", "trading_pair", "controller_name", "close_type"], observed=True).agg(metric_count=("close_type", "count")).reset_index()
             index_cols = ["exchange", "trading_pair", "controller_name"]
             pivot_executors = pd.pivot_table(grouped_executors, values="metric_count", index=index_cols, columns="close_type").reset_index()
             result_cols = ["TAKE_PROFIT", "STOP_LOSS", "TRAILING_STOP", "TIME_LIMIT"]
@@ -76,28 +289,25 @@ class StrategyData:
         return strategy_summary
 
     def get_single_market_strategy_data(self, exchange: str, trading_pair: str):
-        orders = self.orders[(self.orders["market"] == exchange) & (self.orders["symbol"] == trading_pair)].copy()
-        trade_fill = self.trade_fill[self.trade_fill["order_id"].isin(orders["id"])].copy()
-        order_status = self.order_status[self.order_status["order_id"].isin(orders["id"])].copy()
-        if self.market_data is not None:
-            market_data = self.market_data[(self.market_data["exchange"] == exchange) &
-                                           (self.market_data["trading_pair"] == trading_pair)].copy()
-        else:
-            market_data = None
-        if self.position_executor is not None:
-            position_executor = self.position_executor[(self.position_executor["exchange"] == exchange) &
-                                                       (self.position_executor["trading_pair"] == trading_pair)].copy()
-        else:
-            position_executor = None
-        return SingleMarketStrategyData(
-            exchange=exchange,
-            trading_pair=trading_pair,
-            orders=orders,
-            order_status=order_status,
-            trade_fill=trade_fill,
-            market_data=market_data,
-            position_executor=position_executor
-        )
+        """
+        Tables of one market, sliced from the partitions built with the StrategyData and kept for the next call.
+        """
+        market = (exchange, trading_pair)
+        if self._market_partitions is None:
+            self._markets, self._market_partitions = self._get_market_partitions()
+        if market not in self._single_market_strategy_data:
+            market_code = self._markets.get_loc(market) if market in self._markets else -1
+            self._single_market_strategy_data[market] = SingleMarketStrategyData(
+                exchange=exchange,
+                trading_pair=trading_pair,
+                orders=self._get_market_partition("orders", market_code),
+                order_status=self._get_market_partition("order_status", market_code),
+                trade_fill=self._get_market_partition("trade_fill", market_code),
+                market_data=self._get_market_partition("market_data", market_code),
+                position_executor=self._get_market_partition("position_executor", market_code),
+                pnl_method=self.pnl_method
+            )
+        return self._single_market_strategy_data[market]
 
     @property
     def exchanges(self):
@@ -140,6 +350,10 @@ class StrategyData:
         return self.total_buy_trades + self.total_sell_trades
 
 
+# Horizons after each fill at which the markouts are measured, as pandas offsets
+MARKOUT_HORIZONS = ["1s", "10s", "1min", "5min"]
+
+
 @dataclass
 class SingleMarketStrategyData:
     exchange: str
@@ -149,20 +363,35 @@ class SingleMarketStrategyData:
     trade_fill: pd.DataFrame
     market_data: pd.DataFrame = None
     position_executor: pd.DataFrame = None
+    pnl_method: str = "mark_to_fill"
+
+    @staticmethod
+    def _get_time_slice(table: pd.DataFrame, timestamps, start_date, end_date):
+        """
+        Rows of table whose timestamps are within [start_date, end_date]. Sorted timestamps, as given by
+        StrategyData.get_single_market_strategy_data, are sliced with a binary search without copying the table.
+        """
+        timestamps = pd.Index(timestamps)
+        if not timestamps.is_monotonic_increasing:
+            return table[(timestamps >= start_date) & (timestamps <= end_date)]
+        start = timestamps.searchsorted(start_date, side="left")
+        end = timestamps.searchsorted(end_date, side="right")
+        return table.iloc[start:end]
 
     def get_filtered_strategy_data(self, start_date: datetime.datetime, end_date: datetime.datetime):
-        orders = self.orders[
-            (self.orders["creation_timestamp"] >= start_date) & (self.orders["creation_timestamp"] <= end_date)].copy()
-        trade_fill = self.trade_fill[self.trade_fill["order_id"].isin(orders["id"])].copy()
-        order_status = self.order_status[self.order_status["order_id"].isin(orders["id"])].copy()
+        orders = self._get_time_slice(self.orders, self.orders["creation_timestamp"], start_date, end_date)
+        trade_fill = self._get_time_slice(self.trade_fill, self.trade_fill["timestamp"], start_date, end_date)
+        # OrderStatus timestamps are not converted by the loader and are still in milliseconds
+        order_status = self._get_time_slice(self.order_status, self.order_status["timestamp"],
+                                            pd.Timestamp(start_date).value // 10 ** 6,
+                                            pd.Timestamp(end_date).value // 10 ** 6)
         if self.market_data is not None:
-            market_data = self.market_data[
-                (self.market_data.index >= start_date) & (self.market_data.index <= end_date)].copy()
+            market_data = self._get_time_slice(self.market_data, self.market_data.index, start_date, end_date)
         else:
             market_data = None
         if self.position_executor is not None:
-            position_executor = self.position_executor[(self.position_executor.datetime >= start_date) &
-                                                       (self.position_executor.datetime <= end_date)].copy()
+            position_executor = self._get_time_slice(self.position_executor, self.position_executor["datetime"],
+                                                     start_date, end_date)
         else:
             position_executor = None
         return SingleMarketStrategyData(
@@ -172,9 +401,98 @@ class SingleMarketStrategyData:
             order_status=order_status,
             trade_fill=trade_fill,
             market_data=market_data,
-            position_executor=position_executor
+            position_executor=position_executor,
+            pnl_method=self.pnl_method
         )
 
+    def get_equity_curve(self, interval: str = None):
+        """
+        Mark-to-market pnl of the market at every market data tick, or at the last tick of every interval (a pandas
+        offset like "1min"). The running inventory, cash flow and realized pnl of the fills are as-of joined onto the
+        mid price, so the pnl of the open inventory between fills is visible. The curve starts from a flat position at
+        the first fill of the data, a time filtered SingleMarketStrategyData ignores the inventory held before it.
+        """
+        groupers = ["config_file_path", "market", "symbol"]
+        trade_fill = self.trade_fill.sort_values("timestamp", kind="stable")
+        net_amount = trade_fill["amount"] * np.where(trade_fill["trade_type"] == "BUY", 1, -1)
+        # The realized pnl of every config is derived again from the fills of the data, starting flat like the
+        # inventory and the cash flow. The net_realized_pnl of a time filtered range also counts the inventory held
+        # before it, which the rest of the curve leaves out.
+        if self.pnl_method == "mark_to_fill":
+            # Cash flow plus the inventory marked at the price of the config's last fill
+            fills = trade_fill[groupers].assign(net_amount=net_amount,
+                                                net_amount_quote=net_amount * trade_fill["price"])
+            cumulative = fills.groupby(groupers, sort=False, dropna=False, observed=True)[
+                ["net_amount", "net_amount_quote"]].cumsum()
+            fills["realized_trade_pnl"] = (cumulative["net_amount"] * trade_fill["price"] -
+                                           cumulative["net_amount_quote"])
+            gross_pnl = fills.groupby(groupers, sort=False, dropna=False, observed=True)["realized_trade_pnl"].diff()
+            gross_pnl = gross_pnl.fillna(fills["realized_trade_pnl"])
+        else:
+            gross_pnl = apply_pnl_method(trade_fill, self.pnl_method)["gross_pnl"].fillna(0)
+        realized_pnl_change = gross_pnl - trade_fill["trade_fee_in_quote"]
+        running_fills = pd.DataFrame({"timestamp": trade_fill["timestamp"].to_numpy(),
+                                      "inventory": net_amount.cumsum().to_numpy(),
+                                      "cash_flow": (-net_amount * trade_fill["price"]).cumsum().to_numpy(),
+                                      "cum_fees_in_quote": trade_fill["trade_fee_in_quote"].cumsum().to_numpy(),
+                                      "realized_pnl": realized_pnl_change.cumsum().to_numpy()})
+        mid_price = self.market_data["mid_price"].sort_index()
+        if interval is not None:
+            # The last tick keeps its own timestamp, so the fills are joined as of the moment the price was quoted
+            mid_price = mid_price.dropna().groupby(pd.Grouper(freq=interval)).tail(1)
+        equity_curve = pd.merge_asof(mid_price.rename("mid_price").rename_axis("timestamp").reset_index(),
+                                     running_fills, on="timestamp", direction="backward")
+        # Ticks before the first fill have no inventory yet
+        equity_curve[["inventory", "cash_flow", "cum_fees_in_quote", "realized_pnl"]] = equity_curve[
+            ["inventory", "cash_flow", "cum_fees_in_quote", "realized_pnl"]].fillna(0)
+        equity_curve["total_pnl"] = (equity_curve["cash_flow"] + equity_curve["inventory"] * equity_curve["mid_price"] -
+                                     equity_curve["cum_fees_in_quote"])
+        equity_curve["unrealized_pnl"] = equity_curve["total_pnl"] - equity_curve["realized_pnl"]
+        return equity_curve.set_index("timestamp")
+
+    def get_markouts(self, horizons=None):
+        """
+        Signed markout of every fill in basis points: how much the mid price moved in favour of the fill (up after a
+        buy, down after a sell) horizon after it. Negative markouts mean adverse selection. The mid price at each
+        horizon is found with one binary search over the market data per horizon, and is NaN past the last tick.
+        """
+        horizons = horizons or MARKOUT_HORIZONS
+        mid_price = self.market_data["mid_price"].sort_index()
+        mid_timestamps = mid_price.index.to_numpy()
+        mid_prices = mid_price.to_numpy(dtype=float)
+        fill_timestamps = self.trade_fill["timestamp"].to_numpy()
+        fill_prices = self.trade_fill["price"].to_numpy(dtype=float)
+        side = np.where(self.trade_fill["trade_type"] == "BUY", 1, -1)
+        markouts = pd.DataFrame({"timestamp": self.trade_fill["timestamp"].to_numpy(),
+                                 "trade_type": self.trade_fill["trade_type"].to_numpy(),
+                                 "hour": self.trade_fill["timestamp"].dt.hour.to_numpy(),
+                                 "price": fill_prices,
+                                 "amount": self.trade_fill["amount"].to_numpy(dtype=float)},
+                                index=self.trade_fill.index)
+        if "level" in self.trade_fill:
+            markouts["level"] = self.trade_fill["level"].to_numpy()
+        for horizon in horizons:
+            if len(mid_prices) == 0:
+                markouts[f"markout_{horizon}"] = np.nan
+                continue
+            horizon_timestamps = fill_timestamps + pd.Timedelta(horizon).to_timedelta64()
+            positions = np.searchsorted(mid_timestamps, horizon_timestamps, side="right") - 1
+            is_valid = (positions >= 0) & (horizon_timestamps <= mid_timestamps[-1])
+            horizon_prices = np.where(is_valid, mid_prices[positions.clip(0)], np.nan)
+            markouts[f"markout_{horizon}"] = side * (horizon_prices - fill_prices) / fill_prices * 10000
+        return markouts
+
+    def get_markouts_summary(self, horizons=None, by="trade_type"):
+        """
+        Mean markout in basis points at each horizon, with the number of fills, grouped by trade_type, hour or level.
+        """
+        horizons = horizons or MARKOUT_HORIZONS
+        markouts = self.get_markouts(horizons)
+        markout_columns = [f"markout_{horizon}" for horizon in horizons]
+        summary = markouts.groupby(by, observed=True).agg(fills=("price", "count"),
+                                                          **{column: (column, "mean") for column in markout_columns})
+        return summary.reset_index()
+
     def get_market_data_resampled(self, interval):
         data_resampled = self.market_data.resample(interval).agg({
             "mid_price": "ohlc",
@@ -192,104 +510,149 @@ class SingleMarketStrategyData:
     def quote_asset(self):
         return self.trading_pair.split("-")[1]
 
+    @cached_property
+    def metrics(self):
+        """
+        Every summary statistic of the market, computed in one vectorized pass over trade_fill the first time one of
+        them is accessed. The tables are not expected to change after the SingleMarketStrategyData is created.
+        """
+        trade_fill = self.trade_fill
+        amount = trade_fill["amount"].to_numpy(dtype=float)
+        price = trade_fill["price"].to_numpy(dtype=float)
+        is_buy = (trade_fill["trade_type"] == "BUY").to_numpy() & ~np.isnan(amount)
+        is_sell = (trade_fill["trade_type"] == "SELL").to_numpy() & ~np.isnan(amount)
+        net_realized_pnl = trade_fill["net_realized_pnl"].to_numpy(dtype=float)
+        realized_pnl = trade_fill["realized_pnl"].to_numpy(dtype=float)
+
+        total_buy_amount = amount[is_buy].sum()
+        total_sell_amount = amount[is_sell].sum()
+        total_buy_trades = is_buy.sum()
+        total_sell_trades = is_sell.sum()
+        average_buy_price = np.nan_to_num((amount[is_buy] * price[is_buy]).sum() / total_buy_amount, nan=0) \
+            if total_buy_amount != 0 else 0
+        average_sell_price = np.nan_to_num((amount[is_sell] * price[is_sell]).sum() / total_sell_amount, nan=0) \
+            if total_sell_amount != 0 else 0
+        start_price = price[0] if len(price) > 0 else np.nan
+        end_price = price[-1] if len(price) > 0 else np.nan
+        inventory_change_base_asset = total_buy_amount - total_sell_amount
+        trade_pnl_quote = (total_sell_amount * average_sell_price - total_buy_amount * average_buy_price +
+                           inventory_change_base_asset * end_price)
+        cum_fees_in_quote = np.nansum(trade_fill["trade_fee_in_quote"].to_numpy(dtype=float))
+        if self.pnl_method == "mark_to_fill":
+            total_wins = (net_realized_pnl >= 0).sum()
+            total_losses = (net_realized_pnl < 0).sum()
+        else:
+            # Only the closing fills realize pnl with the lot matching methods, realized_pnl is NaN for the others
+            total_wins = (realized_pnl >= 0).sum()
+            total_losses = (realized_pnl < 0).sum()
+        total_profit = realized_pnl[realized_pnl >= 0].sum()
+        total_loss = realized_pnl[realized_pnl < 0].sum()
+        start_time = self.orders["creation_timestamp"].min()
+        end_time = self.orders["last_update_timestamp"].max()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {"start_time": start_time,
+                    "end_time": end_time,
+                    "duration_seconds": (end_time - start_time).total_seconds(),
+                    "start_price": start_price,
+                    "end_price": end_price,
+                    "total_buy_amount": total_buy_amount,
+                    "total_sell_amount": total_sell_amount,
+                    "total_buy_trades": total_buy_trades,
+                    "total_sell_trades": total_sell_trades,
+                    "total_orders": total_buy_trades + total_sell_trades,
+                    "average_buy_price": average_buy_price,
+                    "average_sell_price": average_sell_price,
+                    "price_change": (end_price - start_price) / start_price,
+                    "trade_pnl_quote": trade_pnl_quote,
+                    "cum_fees_in_quote": cum_fees_in_quote,
+                    "net_pnl_quote": trade_pnl_quote - cum_fees_in_quote,
+                    "inventory_change_base_asset": inventory_change_base_asset,
+                    "accuracy": total_wins / (total_wins + total_losses),
+                    "profit_factor": total_profit / -total_loss}
+
+    @property
+    def buys(self):
+        return self.trade_fill[self.trade_fill["trade_type"] == "BUY"]
+
+    @property
+    def sells(self):
+        return self.trade_fill[self.trade_fill["trade_type"] == "SELL"]
+
     @property
     def start_time(self):
-        return self.orders["creation_timestamp"].min()
+        return self.metrics["start_time"]
 
     @property
     def end_time(self):
-        return self.orders["last_update_timestamp"].max()
+        return self.metrics["end_time"]
 
     @property
     def duration_seconds(self):
-        return (self.end_time - self.start_time).total_seconds()
+        return self.metrics["duration_seconds"]
 
     @property
     def start_price(self):
-        return self.trade_fill["price"].iat[0]
+        return self.metrics["start_price"]
 
     @property
     def end_price(self):
-        return self.trade_fill["price"].iat[-1]
-
-    @property
-    def buys(self):
-        return self.trade_fill[self.trade_fill["trade_type"] == "BUY"]
-
-    @property
-    def sells(self):
-        return self.trade_fill[self.trade_fill["trade_type"] == "SELL"]
+        return self.metrics["end_price"]
 
     @property
     def total_buy_amount(self):
-        return self.buys["amount"].sum()
+        return self.metrics["total_buy_amount"]
 
     @property
     def total_sell_amount(self):
-        return self.sells["amount"].sum()
+        return self.metrics["total_sell_amount"]
 
     @property
     def total_buy_trades(self):
-        return self.buys["amount"].count()
+        return self.metrics["total_buy_trades"]
 
     @property
     def total_sell_trades(self):
-        return self.sells["amount"].count()
+        return self.metrics["total_sell_trades"]
 
     @property
     def total_orders(self):
-        return self.total_buy_trades + self.total_sell_trades
+        return self.metrics["total_orders"]
 
     @property
     def average_buy_price(self):
-        if self.total_buy_amount != 0:
-            average_price = (self.buys["price"] * self.buys["amount"]).sum() / self.total_buy_amount
-            return np.nan_to_num(average_price, nan=0)
-        else:
-            return 0
+        return self.metrics["average_buy_price"]
 
     @property
     def average_sell_price(self):
-        if self.total_sell_amount != 0:
-            average_price = (self.sells["price"] * self.sells["amount"]).sum() / self.total_sell_amount
-            return np.nan_to_num(average_price, nan=0)
-        else:
-            return 0
+        return self.metrics["average_sell_price"]
 
     @property
     def price_change(self):
-        return (self.end_price - self.start_price) / self.start_price
+        return self.metrics["price_change"]
 
     @property
     def trade_pnl_quote(self):
-        buy_volume = self.buys["amount"].sum() * self.average_buy_price
-        sell_volume = self.sells["amount"].sum() * self.average_sell_price
-        inventory_change_volume = self.inventory_change_base_asset * self.end_price
-        return sell_volume - buy_volume + inventory_change_volume
+        return self.metrics["trade_pnl_quote"]
 
     @property
     def cum_fees_in_quote(self):
-        return self.trade_fill["trade_fee_in_quote"].sum()
+        return self.metrics["cum_fees_in_quote"]
 
     @property
     def net_pnl_quote(self):
-        return self.trade_pnl_quote - self.cum_fees_in_quote
+        return self.metrics["net_pnl_quote"]
 
     @property
     def inventory_change_base_asset(self):
-        return self.total_buy_amount - self.total_sell_amount
+        return self.metrics["inventory_change_base_asset"]
 
     @property
     def accuracy(self):
-        total_wins = (self.trade_fill["net_realized_pnl"] >= 0).sum()
-        total_losses = (self.trade_fill["net_realized_pnl"] < 0).sum()
-        return total_wins / (total_wins + total_losses)
+        return self.metrics["accuracy"]
 
     @property
     def profit_factor(self):
-        total_profit = self.trade_fill.loc[self.trade_fill["realized_pnl"] >= 0, "realized_pnl"].sum()
-        total_loss = self.trade_fill.loc[self.trade_fill["realized_pnl"] < 0, "realized_pnl"].sum()
-        return total_profit / -total_loss
+        return self.metrics["profit_factor"]
 
     @property
     def properties_table(self):
@@ -1,56 +1,311 @@
+import inspect
+import numbers
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial, wraps
+from typing import Optional
 import streamlit as st
 
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
 
-from utils.data_manipulation import StrategyData
+from utils.data_manipulation import StrategyData, concat_tables
+from utils.engine_registry import get_engine
+from utils.pnl_methods import get_fill_segments
+from utils.query_cache import QUERY_CACHE, QueryCache, get_db_fingerprint
+from utils.snapshot_cache import SnapshotCache
+
+
+def snapshot_cached(loader):
+    """Serve the loader from the manager's snapshot cache, if it has one, keyed by its bound arguments."""
+    signature = inspect.signature(loader)
+
+    @wraps(loader)
+    def wrapper(self, *args, **kwargs):
+        if self.snapshot_cache is None:
+            return loader(self, *args, **kwargs)
+        bound_args = signature.bind(self, *args, **kwargs)
+        bound_args.apply_defaults()
+        loader_kwargs = {key: value for key, value in bound_args.arguments.items() if key != "self"}
+        return self.snapshot_cache.get_or_load(self.db_name, loader.__name__, loader_kwargs,
+                                               lambda: loader(self, *args, **kwargs))
+    return wrapper
 
 
 class DatabaseManager:
-    def __init__(self, db_name: str, executors_path: str = "data"):
+    # Column names used to filter each table: (exchange, trading pair, timestamp, timestamp units per millisecond)
+    FILTER_COLUMNS = {
+        "Order": ("market", "symbol", "creation_timestamp", 1),
+        "TradeFill": ("market", "symbol", "timestamp", 1),
+        "OrderStatus": (None, None, "timestamp", 1),
+        "MarketData": ("exchange", "trading_pair", "timestamp", 10 ** 6),
+        "PositionExecutors": ("exchange", "trading_pair", "timestamp", 1e-3),
+    }
+    INDEXES = {
+        "Order": ("market", "symbol", "creation_timestamp"),
+        "TradeFill": ("market", "symbol", "timestamp"),
+        "OrderStatus": ("order_id", "timestamp"),
+        "MarketData": ("exchange", "trading_pair", "timestamp"),
+        "PositionExecutors": ("exchange", "trading_pair", "timestamp"),
+    }
+    # Columns the loaders and StrategyData rely on, checked by the status probe
+    REQUIRED_COLUMNS = {
+        "Order": ["id", "config_file_path", "market", "symbol", "amount", "price", "creation_timestamp",
+                  "last_update_timestamp"],
+        "TradeFill": ["config_file_path", "strategy", "market", "symbol", "timestamp", "order_id", "trade_type",
+                      "price", "amount", "trade_fee_in_quote"],
+        "OrderStatus": ["order_id", "timestamp", "status"],
+        "MarketData": ["timestamp", "exchange", "trading_pair", "mid_price", "best_bid", "best_ask"],
+        "PositionExecutors": ["timestamp", "exchange", "trading_pair", "close_type", "controller_name",
+                              "order_level"],
+    }
+    STATUS_TABLES = {
+        "trade_fill": "TradeFill",
+        "orders": "Order",
+        "order_status": "OrderStatus",
+        "market_data": "MarketData",
+        "position_executor": "PositionExecutors",
+    }
+    # Columns loaded by each profile, "all" loads every column. Pages should ask for the smallest profile they render.
+    COLUMN_PROFILES = {
+        "minimal": {
+            "Order": ["id", "config_file_path", "market", "symbol", "creation_timestamp", "last_update_timestamp"],
+            "TradeFill": REQUIRED_COLUMNS["TradeFill"],
+            "OrderStatus": REQUIRED_COLUMNS["OrderStatus"],
+            "MarketData": REQUIRED_COLUMNS["MarketData"],
+            "PositionExecutors": ["timestamp", "exchange", "trading_pair", "close_type", "controller_name"],
+        },
+        "charts": {
+            "Order": REQUIRED_COLUMNS["Order"] + ["strategy", "order_type", "last_status"],
+            "TradeFill": REQUIRED_COLUMNS["TradeFill"] + ["base_asset", "quote_asset", "order_type"],
+            "OrderStatus": REQUIRED_COLUMNS["OrderStatus"],
+            "MarketData": REQUIRED_COLUMNS["MarketData"],
+            "PositionExecutors": REQUIRED_COLUMNS["PositionExecutors"] + [
+                "side", "amount", "entry_price", "close_price", "close_timestamp", "net_pnl_quote", "sl", "tp", "tl",
+                "open_order_type", "leverage"],
+        },
+        "all": None,
+    }
+    # Levels of the candles pyramid with their size in seconds and the level they are derived from
+    CANDLES_PYRAMID = {
+        "1m": (60, None),
+        "3m": (60 * 3, "1m"),
+        "5m": (60 * 5, "1m"),
+        "15m": (60 * 15, "5m"),
+        "30m": (60 * 30, "15m"),
+        "1h": (60 * 60, "30m"),
+        "6h": (60 * 60 * 6, "1h"),
+        "1d": (60 * 60 * 24, "6h"),
+    }
+    _status_cache = {}
+    # StrategyData kept by get_strategy_data, one per set of arguments, so the chart and the export loads of a page
+    # don't replace each other. The least recently used one is dropped past this number
+    MAX_STRATEGY_DATA = 2
+
+    def __init__(self, db_name: str, executors_path: str = "data", snapshot_cache: Optional[SnapshotCache] = None,
+                 query_cache: Optional[QueryCache] = QUERY_CACHE):
         self.db_name = db_name
+        self.snapshot_cache = snapshot_cache
+        self.query_cache = query_cache
         # TODO: Create db path for all types of db
         self.db_path = f'sqlite:///{os.path.join(db_name)}'
-        self.engine = create_engine(self.db_path, connect_args={'check_same_thread': False})
+        # Bots keep writing to these files, so they are only read through the shared read-only engine
+        self.engine = get_engine(db_name, read_only=True)
         self.session_maker = sessionmaker(bind=self.engine)
+        # Frames already loaded in incremental mode, with the high-water mark of each table
+        self._tail_state = {}
+        self._tail_filters = None
+        self._tail_lock = threading.Lock()
+        # Seconds spent loading each table in the last get_strategy_data call
+        self.load_timings = {}
+        # Candles pyramid of each market, with the fingerprint of the database it was built from
+        self._candles_pyramids = {}
+        # Last StrategyData returned by get_strategy_data for each set of arguments, with the fingerprint of the
+        # database and the load timings
+        self._strategy_data = OrderedDict()
+        self._strategy_data_lock = threading.Lock()
+
+    @staticmethod
+    def _get_index_name(table_name: str, columns):
+        return f"dashboard_{table_name.lower()}_{'_'.join(columns)}"
+
+    def get_missing_indexes(self):
+        """
+        Tables of INDEXES that exist in the database without their index. The queries work without them, but the
+        market and time filters of the loaders then scan the whole table.
+        """
+        try:
+            with self.engine.connect() as connection:
+                rows = connection.execute(text("SELECT type, name FROM sqlite_master WHERE type IN ('table', 'index')"))
+                names = {(row_type, name) for row_type, name in rows}
+        except Exception:
+            return []
+        return [table_name for table_name, columns in self.INDEXES.items()
+                if ("table", table_name) in names and ("index", self._get_index_name(table_name, columns)) not in names]
+
+    def is_live(self, idle_seconds: int = 300):
+        """Whether the database or its WAL file was written in the last idle_seconds, e.g. by a running bot."""
+        modified_times = [os.path.getmtime(path) for path in [self.db_name, f"{self.db_name}-wal"]
+                          if os.path.exists(path)]
+        return len(modified_times) > 0 and time.time() - max(modified_times) < idle_seconds
 
-    def get_strategy_data(self, config_file_path=None, start_date=None, end_date=None):
-        def load_data(table_loader):
+    def create_indexes(self):
+        """
+        Create the missing INDEXES so the market and time filters of the loaders use an index range scan. Building an
+        index holds the write lock of the database until it finishes, so a running bot can't write in the meantime
+        and the file is modified. It is never done implicitly, pages only offer it for databases that are not live.
+        Returns the tables whose index could not be created.
+        """
+        writable_engine = get_engine(self.db_name, read_only=False)
+        failed_tables = []
+        for table_name in self.get_missing_indexes():
+            columns = self.INDEXES[table_name]
+            try:
+                with writable_engine.begin() as connection:
+                    connection.execute(text(f"CREATE INDEX IF NOT EXISTS {self._get_index_name(table_name, columns)} "
+                                            f"ON '{table_name}' ({', '.join(columns)})"))
+            except Exception:
+                failed_tables.append(table_name)  # Locked or read-only database
+        return failed_tables
+
+    def get_strategy_data(self, config_file_path=None, start_date=None, end_date=None, exchange=None,
+                          trading_pair=None, incremental=False, concurrent=False, max_workers=5, columns="all",
+                          compact=False, float32=False):
+        """
+        Load the strategy tables into a StrategyData. A table that fails to load is returned as None.
+        :param incremental: Only read the rows added since the previous incremental load
+        :param concurrent: Load the tables in parallel on a pool of max_workers threads, each with its own connection
+        :param columns: Name of a COLUMN_PROFILES profile or a {table: [columns]} dict, only those columns are read
+        :param compact: Load the StrategyData.CATEGORICAL_COLUMNS as categoricals and the ORDER_ID_COLUMNS as
+        categoricals sharing one set of categories, float32 also stores the FLOAT32_COLUMNS as float32
+        """
+        load_timings = {}
+
+        def load_data(table_name, table_loader):
+            start = time.perf_counter()
             try:
                 return table_loader()
             except Exception as e:
                 return None  # Return None to indicate failure
+            finally:
+                load_timings[table_name] = time.perf_counter() - start
+
+        market_filters = dict(exchange=exchange, trading_pair=trading_pair, start_date=start_date, end_date=end_date)
+        filters = dict(config_file_path=config_file_path, **market_filters)
+        if isinstance(columns, str):
+            columns = self.COLUMN_PROFILES[columns] or {}
+        table_columns = {table_name: columns.get(table_name, "all") for table_name in self.REQUIRED_COLUMNS}
+        # Reruns that ask for the same data of an unchanged database get the same StrategyData back, so the market
+        # partitions, metrics and single market data it computed lazily are kept
+        fingerprint = get_db_fingerprint(os.path.abspath(self.db_name))
+        strategy_data_args = (repr(filters), repr(table_columns), incremental, compact, float32)
+        with self._strategy_data_lock:
+            cached_fingerprint, cached_strategy_data, cached_load_timings = self._strategy_data.pop(
+                strategy_data_args, (None, None, None))
+            if cached_fingerprint == fingerprint:
+                self._strategy_data[strategy_data_args] = (fingerprint, cached_strategy_data, cached_load_timings)
+                self.load_timings = cached_load_timings
+                return cached_strategy_data
+        # Compact dtypes are applied by the loaders, before their frames reach the query cache and the tail state
+        compact_args = dict(compact=compact, float32=float32)
+        if incremental:
+            table_loaders = {
+                "orders": partial(self.get_orders_tail, columns=table_columns["Order"], **compact_args, **filters),
+                "trade_fill": partial(self.get_trade_fills_tail, columns=table_columns["TradeFill"], **compact_args,
+                                      **filters),
+                "order_status": partial(self.get_order_status_tail, columns=table_columns["OrderStatus"],
+                                        **compact_args, **filters),
+                "market_data": partial(self.get_market_data_tail, columns=table_columns["MarketData"],
+                                       **compact_args, **market_filters),
+                "position_executor": partial(self.get_position_executor_data_tail,
+                                             columns=table_columns["PositionExecutors"], **compact_args,
+                                             **market_filters),
+            }
+        else:
+            table_loaders = {
+                "orders": partial(self.get_orders, columns=table_columns["Order"], **compact_args, **filters),
+                "trade_fill": partial(self.get_trade_fills, columns=table_columns["TradeFill"], **compact_args,
+                                      **filters),
+                "order_status": partial(self.get_order_status, columns=table_columns["OrderStatus"], **compact_args,
+                                        **filters),
+                "market_data": partial(self.get_market_data, columns=table_columns["MarketData"], **compact_args,
+                                       **market_filters),
+                "position_executor": partial(self.get_position_executor_data,
+                                             columns=table_columns["PositionExecutors"], **compact_args,
+                                             **market_filters),
+            }
 
         # Use load_data to load tables
-        orders = load_data(self.get_orders)
-        trade_fills = load_data(self.get_trade_fills)
-        order_status = load_data(self.get_order_status)
-        market_data = load_data(self.get_market_data)
-        position_executor = load_data(self.get_position_executor_data)
+        start_time = time.perf_counter()
+        with self._tail_lock if incremental else nullcontext():
+            # The tail state only holds the rows of one set of filters and columns, start over if they changed
+            tail_filters = dict(filters, columns=table_columns, **compact_args)
+            if incremental and tail_filters != self._tail_filters:
+                self._tail_state = {}
+                self._tail_filters = tail_filters
+            if concurrent:
+                with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-loader") as executor:
+                    futures = {table_name: executor.submit(load_data, table_name, table_loader)
+                               for table_name, table_loader in table_loaders.items()}
+                    tables = {table_name: future.result() for table_name, future in futures.items()}
+            else:
+                tables = {table_name: load_data(table_name, table_loader)
+                          for table_name, table_loader in table_loaders.items()}
+        load_timings["total"] = time.perf_counter() - start_time
+        self.load_timings = load_timings
 
-        strategy_data = StrategyData(orders, order_status, trade_fills, market_data, position_executor)
+        strategy_data = StrategyData(tables["orders"], tables["order_status"], tables["trade_fill"],
+                                     tables["market_data"], tables["position_executor"])
+        if compact:
+            strategy_data.share_order_id_categories()
+        with self._strategy_data_lock:
+            self._strategy_data[strategy_data_args] = (fingerprint, strategy_data, load_timings)
+            while len(self._strategy_data) > self.MAX_STRATEGY_DATA:
+                self._strategy_data.popitem(last=False)
         return strategy_data
 
     @staticmethod
-    def _get_table_status(table_loader):
+    def _get_table_status(connection, table_name, existing_tables):
+        if table_name not in existing_tables:
+            return f"Error - no such table: {table_name}"
+        columns = pd.read_sql_query(text(f"PRAGMA table_info('{table_name}')"), connection)["name"]
+        missing_columns = [column for column in DatabaseManager.REQUIRED_COLUMNS[table_name]
+                           if column not in columns.values]
+        if missing_columns:
+            return f"Error - Missing columns: {', '.join(missing_columns)}"
+        has_records = connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM '{table_name}')")).scalar()
+        return "Correct" if has_records else f"Error - No records matched"
+
+    def _get_status(self):
+        status = {"db_name": self.db_name}
         try:
-            data = table_loader()
-            return "Correct" if len(data) > 0 else f"Error - No records matched"
+            with self.session_maker() as session:
+                connection = session.connection()
+                existing_tables = pd.read_sql_query(text("SELECT name FROM sqlite_master WHERE type = 'table'"),
+                                                    connection)["name"].tolist()
+                for status_key, table_name in self.STATUS_TABLES.items():
+                    status[status_key] = self._get_table_status(connection, table_name, existing_tables)
         except Exception as e:
-            return f"Error - {str(e)}"
+            for status_key in self.STATUS_TABLES:
+                status[status_key] = f"Error - {str(e)}"
+        return status
 
     @property
     def status(self):
-        status = {"db_name": self.db_name,
-                  "trade_fill": self._get_table_status(self.get_trade_fills),
-                  "orders": self._get_table_status(self.get_orders),
-                  "order_status": self._get_table_status(self.get_order_status),
-                  "market_data": self._get_table_status(self.get_market_data),
-                  "position_executor": self._get_table_status(self.get_position_executor_data),
-                  }
-        return status
+        # Only metadata and EXISTS probes, cached until the database file changes
+        db_path = os.path.abspath(self.db_name)
+        fingerprint = get_db_fingerprint(db_path)
+        cached_fingerprint, status = self._status_cache.get(db_path, (None, None))
+        if status is None or cached_fingerprint != fingerprint:
+            status = self._get_status()
+            self._status_cache[db_path] = (fingerprint, status)
+        return dict(status)
 
     @property
     def config_files(self):
@@ -60,144 +315,538 @@ class DatabaseManager:
     def configs(self):
         return {config_file: self.get_exchanges_trading_pairs_by_config_file(config_file) for config_file in self.config_files}
 
+    def _read_sql(self, query, params=None, use_cache=True, categorical_columns=None):
+        def run_query():
+            with self.session_maker() as session:
+                result = pd.read_sql_query(text(query), session.connection(), params=params)
+            # Converted before the result is cached, so the cache holds the compact frame
+            for column in categorical_columns or []:
+                if column in result and result[column].dtype == object:
+                    result[column] = result[column].astype("category")
+            return result
+
+        if self.query_cache is None or not use_cache:
+            return run_query()
+        return self.query_cache.get_or_query(self.db_name, query, params, run_query,
+                                             variant=tuple(categorical_columns) if categorical_columns else None)
+
+    @staticmethod
+    def _get_categorical_columns(table_name, compact):
+        """Columns of a StrategyData table stored as categoricals in compact mode, None outside of it."""
+        if not compact:
+            return None
+        order_id_column = StrategyData.ORDER_ID_COLUMNS.get(table_name)
+        return StrategyData.CATEGORICAL_COLUMNS[table_name] + ([order_id_column] if order_id_column else [])
+
+    @classmethod
+    def _compact_table(cls, table, table_name, compact, float32):
+        """
+        Compact mode dtypes of the columns added by the processing, like the position executors level, plus the
+        float32 chart only columns. The query columns are already categoricals.
+        """
+        if compact:
+            for column in cls._get_categorical_columns(table_name, compact):
+                if column in table and table[column].dtype == object:
+                    table[column] = table[column].astype("category")
+            if float32:
+                for column in StrategyData.FLOAT32_COLUMNS.get(table_name, []):
+                    if column in table:
+                        table[column] = table[column].astype(np.float32)
+        return table
+
     def get_config_files(self):
-        with self.session_maker() as session:
-            query = 'SELECT DISTINCT config_file_path FROM TradeFill'
-            config_files = pd.read_sql_query(text(query), session.connection())
+        query = 'SELECT DISTINCT config_file_path FROM TradeFill'
+        config_files = self._read_sql(query)
         return config_files['config_file_path'].tolist()
 
     def get_exchanges_trading_pairs_by_config_file(self, config_file_path):
-        with self.session_maker() as session:
-            query = f"SELECT DISTINCT market, symbol FROM TradeFill WHERE config_file_path = '{config_file_path}'"
-            exchanges_trading_pairs = pd.read_sql_query(text(query), session.connection())
-            exchanges_trading_pairs["market"] = exchanges_trading_pairs["market"].apply(
-                lambda x: x.lower().replace("_papertrade", ""))
-            exchanges_trading_pairs = exchanges_trading_pairs.groupby("market")["symbol"].apply(list).to_dict()
+        query = "SELECT DISTINCT market, symbol FROM TradeFill WHERE config_file_path = :config_file_path"
+        exchanges_trading_pairs = self._read_sql(query, {"config_file_path": config_file_path})
+        exchanges_trading_pairs["market"] = exchanges_trading_pairs["market"].apply(
+            lambda x: x.lower().replace("_papertrade", ""))
+        exchanges_trading_pairs = exchanges_trading_pairs.groupby("market")["symbol"].apply(list).to_dict()
         return exchanges_trading_pairs
 
     @staticmethod
-    def _get_orders_query(config_file_path=None, start_date=None, end_date=None):
-        query = "SELECT * FROM 'Order'"
-        conditions = []
-        if config_file_path:
-            conditions.append(f"config_file_path = '{config_file_path}'")
-        if start_date:
-            conditions.append(f"created_at >= '{start_date}'")
-        if end_date:
-            conditions.append(f"created_at <= '{end_date}'")
-        if conditions:
-            query += f" WHERE {' AND '.join(conditions)}"
-        return query
+    def _to_milliseconds(date):
+        if date is None or isinstance(date, numbers.Real):
+            # NumPy epochs are converted to Python numbers, which the sqlite driver can bind
+            return date.item() if isinstance(date, np.generic) else date
+        return pd.Timestamp(date).value // 10 ** 6
 
-    @staticmethod
-    def _get_order_status_query(order_ids=None, start_date=None, end_date=None):
-        query = "SELECT * FROM OrderStatus"
+    @classmethod
+    def _get_conditions(cls, table_name, config_file_path=None, exchange=None, trading_pair=None, start_date=None,
+                        end_date=None, order_ids=None):
+        """
+        Build the WHERE conditions and bound parameters of a loader query. Dates can be datetimes or epochs in
+        milliseconds and are converted to the timestamp unit of each table.
+        """
+        exchange_column, trading_pair_column, timestamp_column, timestamp_scale = cls.FILTER_COLUMNS[table_name]
         conditions = []
+        params = {}
+        if table_name == "OrderStatus":
+            # OrderStatus has no market columns, so it is filtered through the orders it belongs to
+            orders_conditions, orders_params = cls._get_conditions("Order", config_file_path, exchange, trading_pair)
+            if orders_conditions:
+                conditions.append(f"order_id IN (SELECT id FROM 'Order' WHERE {' AND '.join(orders_conditions)})")
+                params.update(orders_params)
+        elif config_file_path and table_name in ["Order", "TradeFill"]:
+            conditions.append("config_file_path = :config_file_path")
+            params["config_file_path"] = config_file_path
+        if exchange and exchange_column:
+            conditions.append(f"{exchange_column} = :exchange")
+            params["exchange"] = exchange
+        if trading_pair and trading_pair_column:
+            conditions.append(f"{trading_pair_column} = :trading_pair")
+            params["trading_pair"] = trading_pair
         if order_ids:
-            order_ids_string = ",".join(f"'{order_id}'" for order_id in order_ids)
-            conditions.append(f"order_id IN ({order_ids_string})")
-        if start_date:
-            conditions.append(f"created_at >= '{start_date}'")
-        if end_date:
-            conditions.append(f"created_at <= '{end_date}'")
-        if conditions:
-            query += f" WHERE {' AND '.join(conditions)}"
-        return query
+            order_id_params = {f"order_id_{i}": order_id for i, order_id in enumerate(order_ids)}
+            conditions.append(f"order_id IN ({', '.join(f':{param}' for param in order_id_params)})")
+            params.update(order_id_params)
+        if start_date is not None:
+            conditions.append(f"{timestamp_column} >= :start_timestamp")
+            params["start_timestamp"] = cls._to_milliseconds(start_date) * timestamp_scale
+        if end_date is not None:
+            conditions.append(f"{timestamp_column} <= :end_timestamp")
+            params["end_timestamp"] = cls._to_milliseconds(end_date) * timestamp_scale
+        return conditions, params
 
-    @staticmethod
-    def _get_trade_fills_query(config_file_path=None, start_date=None, end_date=None):
-        query = "SELECT * FROM TradeFill"
-        conditions = []
-        if config_file_path:
-            conditions.append(f"config_file_path = '{config_file_path}'")
-        if start_date:
-            conditions.append(f"created_at >= '{start_date}'")
-        if end_date:
-            conditions.append(f"created_at <= '{end_date}'")
-        if conditions:
-            query += f" WHERE {' AND '.join(conditions)}"
-        return query
+    @classmethod
+    def _get_select_columns(cls, table_name, columns="all"):
+        """
+        Resolve a column profile name or an explicit list of columns into the SELECT list of a table.
+        """
+        if isinstance(columns, str):
+            columns = cls.COLUMN_PROFILES[columns]
+            columns = columns[table_name] if columns is not None else None
+        if columns is None:
+            return "*"
+        return ", ".join(f'"{column}"' for column in columns)
 
-    @staticmethod
-    def _get_market_data_query(start_date=None, end_date=None):
-        query = "SELECT * FROM MarketData"
-        conditions = []
-        if start_date:
-            conditions.append(f"timestamp >= '{start_date * 1e6}'")
-        if end_date:
-            conditions.append(f"timestamp <= '{end_date * 1e6}'")
+    @classmethod
+    def _get_table_query(cls, table_name, columns="all", **filters):
+        query = f"SELECT {cls._get_select_columns(table_name, columns)} FROM '{table_name}'"
+        conditions, params = cls._get_conditions(table_name, **filters)
         if conditions:
             query += f" WHERE {' AND '.join(conditions)}"
-        return query
+        return query, params
+
+    @classmethod
+    def _get_orders_query(cls, config_file_path=None, start_date=None, end_date=None, exchange=None, trading_pair=None,
+                          columns="all"):
+        return cls._get_table_query("Order", columns, config_file_path=config_file_path, exchange=exchange,
+                                    trading_pair=trading_pair, start_date=start_date, end_date=end_date)
+
+    @classmethod
+    def _get_order_status_query(cls, order_ids=None, start_date=None, end_date=None, config_file_path=None,
+                                exchange=None, trading_pair=None, columns="all"):
+        return cls._get_table_query("OrderStatus", columns, order_ids=order_ids, config_file_path=config_file_path,
+                                    exchange=exchange, trading_pair=trading_pair, start_date=start_date,
+                                    end_date=end_date)
+
+    @classmethod
+    def _get_trade_fills_query(cls, config_file_path=None, start_date=None, end_date=None, exchange=None,
+                               trading_pair=None, columns="all"):
+        return cls._get_table_query("TradeFill", columns, config_file_path=config_file_path, exchange=exchange,
+                                    trading_pair=trading_pair, start_date=start_date, end_date=end_date)
+
+    @classmethod
+    def _get_market_data_query(cls, start_date=None, end_date=None, exchange=None, trading_pair=None, columns="all"):
+        return cls._get_table_query("MarketData", columns, exchange=exchange, trading_pair=trading_pair,
+                                    start_date=start_date, end_date=end_date)
+
+    @classmethod
+    def _get_position_executor_query(cls, start_date=None, end_date=None, exchange=None, trading_pair=None,
+                                     columns="all"):
+        return cls._get_table_query("PositionExecutors", columns, exchange=exchange, trading_pair=trading_pair,
+                                    start_date=start_date, end_date=end_date)
 
     @staticmethod
-    def _get_position_executor_query(start_date=None, end_date=None):
-        query = "SELECT * FROM PositionExecutors"
-        conditions = []
-        if start_date:
-            conditions.append(f"timestamp >= '{start_date}'")
-        if end_date:
-            conditions.append(f"timestamp <= '{end_date}'")
-        if conditions:
-            query += f" WHERE {' AND '.join(conditions)}"
-        return query
-
-    def get_orders(self, config_file_path=None, start_date=None, end_date=None):
-        with self.session_maker() as session:
-            query = self._get_orders_query(config_file_path, start_date, end_date)
-            orders = pd.read_sql_query(text(query), session.connection())
-            orders["market"] = orders["market"]
-            orders["amount"] = orders["amount"] / 1e6
-            orders["price"] = orders["price"] / 1e6
-            orders['creation_timestamp'] = pd.to_datetime(orders['creation_timestamp'], unit="ms")
-            orders['last_update_timestamp'] = pd.to_datetime(orders['last_update_timestamp'], unit="ms")
+    def _process_orders(orders):
+        # Each conversion only runs if its column was loaded by the column profile
+        for column in ["amount", "price"]:
+            if column in orders:
+                orders[column] = orders[column] / 1e6
+        for column in ["creation_timestamp", "last_update_timestamp"]:
+            if column in orders:
+                orders[column] = pd.to_datetime(orders[column], unit="ms")
         return orders
 
-    def get_trade_fills(self, config_file_path=None, start_date=None, end_date=None):
+    @staticmethod
+    def _process_trade_fills(trade_fills, last_fills=None):
+        """
+        Convert the raw TradeFill rows and add the cumulative pnl columns. When last_fills (the last processed fill of
+        each config/market/symbol) is provided, the cumulative columns continue from it instead of starting from zero.
+        """
         groupers = ["config_file_path", "market", "symbol"]
         float_cols = ["amount", "price", "trade_fee_in_quote"]
-        with self.session_maker() as session:
-            query = self._get_trade_fills_query(config_file_path, start_date, end_date)
-            trade_fills = pd.read_sql_query(text(query), session.connection())
-            trade_fills[float_cols] = trade_fills[float_cols] / 1e6
-            trade_fills["cum_fees_in_quote"] = trade_fills.groupby(groupers)["trade_fee_in_quote"].cumsum()
-            trade_fills["net_amount"] = trade_fills['amount'] * trade_fills['trade_type'].apply(lambda x: 1 if x == 'BUY' else -1)
-            trade_fills["net_amount_quote"] = trade_fills['net_amount'] * trade_fills['price']
-            trade_fills["cum_net_amount"] = trade_fills.groupby(groupers)["net_amount"].cumsum()
-            trade_fills["unrealized_trade_pnl"] = -1 * trade_fills.groupby(groupers)["net_amount_quote"].cumsum()
-            trade_fills["inventory_cost"] = trade_fills["cum_net_amount"] * trade_fills["price"]
-            trade_fills["realized_trade_pnl"] = trade_fills["unrealized_trade_pnl"] + trade_fills["inventory_cost"]
-            trade_fills["net_realized_pnl"] = trade_fills["realized_trade_pnl"] - trade_fills["cum_fees_in_quote"]
-            trade_fills["realized_pnl"] = trade_fills.groupby(groupers)["net_realized_pnl"].diff()
-            trade_fills["gross_pnl"] = trade_fills.groupby(groupers)["realized_trade_pnl"].diff()
-            trade_fills["trade_fee"] = trade_fills.groupby(groupers)["cum_fees_in_quote"].diff()
-            trade_fills["timestamp"] = pd.to_datetime(trade_fills["timestamp"], unit="ms")
-            trade_fills["market"] = trade_fills["market"]
-            trade_fills["quote_volume"] = trade_fills["price"] * trade_fills["amount"]
+        cum_cols = ["cum_fees_in_quote", "cum_net_amount", "unrealized_trade_pnl"]
+        diff_cols = {"realized_pnl": "net_realized_pnl", "gross_pnl": "realized_trade_pnl", "trade_fee": "cum_fees_in_quote"}
+        if not set(groupers + float_cols + ["trade_type", "timestamp"]).issubset(trade_fills.columns):
+            # The pnl columns can't be derived without their inputs, only convert the columns that were loaded
+            loaded_float_cols = [column for column in float_cols if column in trade_fills]
+            trade_fills[loaded_float_cols] = trade_fills[loaded_float_cols] / 1e6
+            if "timestamp" in trade_fills:
+                trade_fills["timestamp"] = pd.to_datetime(trade_fills["timestamp"], unit="ms")
+            return trade_fills
+        trade_fills[float_cols] = trade_fills[float_cols] / 1e6
+        if len(trade_fills) == 0:
+            for column in ["cum_fees_in_quote", "net_amount", "net_amount_quote", "cum_net_amount",
+                           "unrealized_trade_pnl", "inventory_cost", "realized_trade_pnl", "net_realized_pnl"] + \
+                          list(diff_cols):
+                trade_fills[column] = pd.Series(dtype=float)
+        else:
+            # Sorted once by group and time, every group is then a contiguous segment of the sorted arrays
+            order, starts, ends = get_fill_segments(trade_fills, groupers)
+
+            amount = trade_fills["amount"].to_numpy(dtype=float)[order]
+            price = trade_fills["price"].to_numpy(dtype=float)[order]
+            net_amount = amount * np.where((trade_fills["trade_type"] == "BUY").to_numpy()[order], 1, -1)
+            net_amount_quote = net_amount * price
+            # cum_fees_in_quote, cum_net_amount and unrealized_trade_pnl, in the order of cum_cols
+            cum_values = np.column_stack([trade_fills["trade_fee_in_quote"].to_numpy(dtype=float)[order], net_amount,
+                                          -net_amount_quote])
+            for start, end in zip(starts, ends):
+                np.cumsum(cum_values[start:end], axis=0, out=cum_values[start:end])
+            # The first fill of each group is diffed against the last known fill of the group, or left as NaN
+            previous_values = np.full((len(starts), len(diff_cols)), np.nan)
+            if last_fills is not None:
+                group_keys = trade_fills[groupers].iloc[order[starts]]
+                previous_columns = list(dict.fromkeys(cum_cols + list(diff_cols.values())))
+                previous_fills = group_keys.merge(last_fills[groupers + previous_columns], on=groupers, how="left")
+                cum_values += np.repeat(previous_fills[cum_cols].fillna(0).to_numpy(), ends - starts, axis=0)
+                previous_values = previous_fills[list(diff_cols.values())].to_numpy(dtype=float)
+            inventory_cost = cum_values[:, 1] * price
+            realized_trade_pnl = cum_values[:, 2] + inventory_cost
+            net_realized_pnl = realized_trade_pnl - cum_values[:, 0]
+            derived_columns = {"cum_fees_in_quote": cum_values[:, 0], "net_amount": net_amount,
+                               "net_amount_quote": net_amount_quote, "cum_net_amount": cum_values[:, 1],
+                               "unrealized_trade_pnl": cum_values[:, 2], "inventory_cost": inventory_cost,
+                               "realized_trade_pnl": realized_trade_pnl, "net_realized_pnl": net_realized_pnl}
+            for i, (diff_col, source_col) in enumerate(diff_cols.items()):
+                values = derived_columns[source_col]
+                diffs = np.empty_like(values)
+                diffs[1:] = values[1:] - values[:-1]
+                diffs[starts] = values[starts] - previous_values[:, i]
+                derived_columns[diff_col] = diffs
+            # Written back in the row order of the query, all the columns at once
+            derived_values = np.empty((len(order), len(derived_columns)))
+            derived_values[order] = np.column_stack(list(derived_columns.values()))
+            derived_values = pd.DataFrame(derived_values, columns=list(derived_columns), index=trade_fills.index)
+            # TradeFill already has a trade_fee column (the fee as JSON), it is replaced where it is
+            replaced_columns = [column for column in derived_columns if column in trade_fills]
+            trade_fills[replaced_columns] = derived_values[replaced_columns]
+            trade_fills = pd.concat([trade_fills, derived_values.drop(columns=replaced_columns)], axis=1)
+        trade_fills["timestamp"] = pd.to_datetime(trade_fills["timestamp"], unit="ms")
+        trade_fills["quote_volume"] = trade_fills["price"] * trade_fills["amount"]
         return trade_fills
 
-    def get_order_status(self, order_ids=None, start_date=None, end_date=None):
-        with self.session_maker() as session:
-            query = self._get_order_status_query(order_ids, start_date, end_date)
-            order_status = pd.read_sql_query(text(query), session.connection())
-        return order_status
-
-    def get_market_data(self, start_date=None, end_date=None):
-        with self.session_maker() as session:
-            query = self._get_market_data_query(start_date, end_date)
-            market_data = pd.read_sql_query(text(query), session.connection())
-            market_data["timestamp"] = pd.to_datetime(market_data["timestamp"] / 1e6, unit="ms")
-            market_data.set_index("timestamp", inplace=True)
-            market_data["mid_price"] = market_data["mid_price"] / 1e6
-            market_data["best_bid"] = market_data["best_bid"] / 1e6
-            market_data["best_ask"] = market_data["best_ask"] / 1e6
+    @staticmethod
+    def _process_market_data(market_data):
+        # Stored in nanoseconds, converted directly to avoid the float rounding of going through milliseconds
+        market_data["timestamp"] = pd.to_datetime(market_data["timestamp"], unit="ns")
+        market_data.set_index("timestamp", inplace=True)
+        market_data["mid_price"] = market_data["mid_price"] / 1e6
+        market_data["best_bid"] = market_data["best_bid"] / 1e6
+        market_data["best_ask"] = market_data["best_ask"] / 1e6
         return market_data
 
-    def get_position_executor_data(self, start_date=None, end_date=None) -> pd.DataFrame:
-        with self.session_maker() as session:
-            query = self._get_position_executor_query(start_date, end_date)
-            position_executor = pd.read_sql_query(text(query), session.connection())
-            position_executor.set_index("timestamp", inplace=True)
-            position_executor["datetime"] = pd.to_datetime(position_executor.index, unit="s")
+    @staticmethod
+    def _process_position_executor_data(position_executor):
+        position_executor.set_index("timestamp", inplace=True)
+        position_executor["datetime"] = pd.to_datetime(position_executor.index, unit="s")
+        if "order_level" in position_executor:
             position_executor["level"] = position_executor["order_level"].apply(lambda x: x.split("_")[1])
         return position_executor
+
+    @snapshot_cached
+    def get_orders(self, config_file_path=None, start_date=None, end_date=None, exchange=None, trading_pair=None,
+                   columns="all", compact=False, float32=False):
+        query, params = self._get_orders_query(config_file_path, start_date, end_date, exchange, trading_pair, columns)
+        orders = self._read_sql(query, params, categorical_columns=self._get_categorical_columns("orders", compact))
+        return self._compact_table(self._process_orders(orders), "orders", compact, float32)
+
+    @snapshot_cached
+    def get_trade_fills(self, config_file_path=None, start_date=None, end_date=None, exchange=None,
+                        trading_pair=None, columns="all", compact=False, float32=False):
+        query, params = self._get_trade_fills_query(config_file_path, start_date, end_date, exchange, trading_pair,
+                                                    columns)
+        trade_fills = self._read_sql(query, params,
+                                     categorical_columns=self._get_categorical_columns("trade_fill", compact))
+        return self._compact_table(self._process_trade_fills(trade_fills), "trade_fill", compact, float32)
+
+    @snapshot_cached
+    def get_order_status(self, order_ids=None, start_date=None, end_date=None, config_file_path=None, exchange=None,
+                         trading_pair=None, columns="all", compact=False, float32=False):
+        query, params = self._get_order_status_query(order_ids, start_date, end_date, config_file_path, exchange,
+                                                     trading_pair, columns)
+        order_status = self._read_sql(query, params,
+                                      categorical_columns=self._get_categorical_columns("order_status", compact))
+        return self._compact_table(order_status, "order_status", compact, float32)
+
+    @snapshot_cached
+    def get_market_data(self, start_date=None, end_date=None, exchange=None, trading_pair=None, columns="all",
+                        compact=False, float32=False):
+        query, params = self._get_market_data_query(start_date, end_date, exchange, trading_pair, columns)
+        market_data = self._read_sql(query, params,
+                                     categorical_columns=self._get_categorical_columns("market_data", compact))
+        return self._compact_table(self._process_market_data(market_data), "market_data", compact, float32)
+
+    @snapshot_cached
+    def get_position_executor_data(self, start_date=None, end_date=None, exchange=None,
+                                   trading_pair=None, columns="all", compact=False, float32=False) -> pd.DataFrame:
+        query, params = self._get_position_executor_query(start_date, end_date, exchange, trading_pair, columns)
+        position_executor = self._read_sql(query, params,
+                                           categorical_columns=self._get_categorical_columns("position_executor",
+                                                                                             compact))
+        return self._compact_table(self._process_position_executor_data(position_executor), "position_executor",
+                                   compact, float32)
+
+    def get_trade_fills_summary(self, config_file_path=None, start_date=None, end_date=None, exchange=None,
+                                trading_pair=None):
+        """
+        Aggregate the trade fills of each config/strategy/market/symbol inside SQLite: number of trades, volume, fees
+        and the net realized pnl of the last fill, computed like get_trade_fills does but without loading the fills.
+        """
+        conditions, params = self._get_conditions("TradeFill", config_file_path=config_file_path, exchange=exchange,
+                                                  trading_pair=trading_pair, start_date=start_date, end_date=end_date)
+        # price and amount are fixed point with 6 decimals, products are taken as REAL to avoid integer overflow.
+        # The last price is taken from the fill ranked first by time, ties going to the last inserted as in
+        # get_trade_fills. A bare column next to both MIN() and MAX() would come from an arbitrary row.
+        query = f"""
+            WITH fills AS (
+                SELECT config_file_path, strategy, market, symbol, timestamp, trade_type, price, amount,
+                       trade_fee_in_quote,
+                       ROW_NUMBER() OVER (PARTITION BY config_file_path, strategy, market, symbol
+                                          ORDER BY timestamp DESC, rowid DESC) AS fill_rank
+                FROM TradeFill
+                {f"WHERE {' AND '.join(conditions)}" if conditions else ""}
+            )
+            SELECT config_file_path, strategy, market, symbol, COUNT(*) AS total_trades,
+                   SUM(CAST(price AS REAL) * amount) / 1e12 AS volume,
+                   SUM(trade_fee_in_quote) / 1e6 AS fees,
+                   SUM(CASE WHEN trade_type = 'BUY' THEN amount ELSE -amount END) / 1e6 AS net_amount,
+                   SUM(CASE WHEN trade_type = 'BUY' THEN CAST(price AS REAL) * amount
+                            ELSE -CAST(price AS REAL) * amount END) / 1e12 AS net_amount_quote,
+                   MIN(timestamp) AS first_timestamp, MAX(CASE WHEN fill_rank = 1 THEN price END) / 1e6 AS last_price,
+                   MAX(timestamp) AS last_timestamp
+            FROM fills
+            GROUP BY config_file_path, strategy, market, symbol
+        """
+        summary = self._read_sql(query, params)
+        summary["realized_trade_pnl"] = summary["net_amount"] * summary["last_price"] - summary["net_amount_quote"]
+        summary["net_realized_pnl"] = summary["realized_trade_pnl"] - summary["fees"]
+        summary["first_timestamp"] = pd.to_datetime(summary["first_timestamp"], unit="ms")
+        summary["last_timestamp"] = pd.to_datetime(summary["last_timestamp"], unit="ms")
+        return summary
+
+    @snapshot_cached
+    def get_market_data_ohlc(self, exchange, trading_pair, interval, start_date=None, end_date=None):
+        """
+        Get candles of the mid price, plus the last best bid and ask, aggregated inside SQLite in integer time buckets
+        so the raw ticks are never loaded. The output matches SingleMarketStrategyData.get_market_data_resampled.
+        :param interval: Candle size in seconds, or a pandas offset string like "5min"
+        """
+        if isinstance(interval, str):
+            interval = pd.Timedelta(interval).total_seconds()
+        # MarketData timestamps are stored in nanoseconds
+        bucket_size = int(interval * 1e3 * self.FILTER_COLUMNS["MarketData"][3])
+        conditions, params = self._get_conditions("MarketData", exchange=exchange, trading_pair=trading_pair,
+                                                  start_date=start_date, end_date=end_date)
+        params["bucket_size"] = bucket_size
+        query = f"""
+            WITH buckets AS (
+                SELECT timestamp / :bucket_size AS bucket, MIN(timestamp) AS open_timestamp,
+                       MAX(timestamp) AS close_timestamp, MAX(mid_price) AS high, MIN(mid_price) AS low
+                FROM MarketData
+                WHERE {' AND '.join(conditions)}
+                GROUP BY bucket
+            )
+            SELECT b.bucket * :bucket_size AS timestamp, o.mid_price AS open, b.high, b.low, c.mid_price AS close,
+                   c.best_bid, c.best_ask
+            FROM buckets b
+            JOIN MarketData o ON o.exchange = :exchange AND o.trading_pair = :trading_pair
+                AND o.timestamp = b.open_timestamp
+            JOIN MarketData c ON c.exchange = :exchange AND c.trading_pair = :trading_pair
+                AND c.timestamp = b.close_timestamp
+            ORDER BY b.bucket
+        """
+        candles = self._read_sql(query, params)
+        candles["timestamp"] = pd.to_datetime(candles["timestamp"], unit="ns")
+        candles.set_index("timestamp", inplace=True)
+        price_cols = ["open", "high", "low", "close", "best_bid", "best_ask"]
+        candles[price_cols] = candles[price_cols] / 1e6
+        if len(candles) > 0:
+            # Empty buckets are not returned by SQLite, add them back as NaN rows like pandas resample does
+            candles = candles.reindex(pd.date_range(candles.index[0], candles.index[-1], freq=f"{interval}S",
+                                                    name="timestamp"))
+        return candles
+
+    @staticmethod
+    def _resample_candles(candles, interval):
+        """
+        Merge candles into candles of interval seconds, interval has to be a multiple of their size.
+        """
+        return candles.resample(f"{interval}S").agg({"open": "first", "high": "max", "low": "min", "close": "last",
+                                                     "best_bid": "last", "best_ask": "last"})
+
+    def _extend_candles_pyramid(self, exchange, trading_pair, pyramid):
+        """
+        Add the ticks written since the pyramid was built. The last 1m candle could still have been open, so SQLite
+        only aggregates the ticks from its start, and every level is derived again from its first changed candle.
+        Market data is appended in time order, ticks older than the last 1m candle are not picked up.
+        """
+        last_candle_start = pyramid["1m"].index[-1]
+        # Not snapshot cached, every start date would leave its own snapshot
+        new_candles = self.get_market_data_ohlc.__wrapped__(self, exchange, trading_pair, self.CANDLES_PYRAMID["1m"][0],
+                                                            start_date=last_candle_start)
+        if len(new_candles) == 0:
+            return pyramid
+        extended_pyramid = {}
+        for level, (interval, source_level) in self.CANDLES_PYRAMID.items():
+            candles = pyramid[level]
+            changed_start = new_candles.index[0].floor(f"{interval}S")
+            if source_level is not None:
+                source_candles = extended_pyramid[source_level]
+                new_candles = self._resample_candles(
+                    source_candles.iloc[source_candles.index.searchsorted(changed_start):], interval)
+            extended_pyramid[level] = pd.concat([candles.iloc[:candles.index.searchsorted(changed_start)],
+                                                 new_candles])
+        return extended_pyramid
+
+    def get_market_data_candles_pyramid(self, exchange, trading_pair):
+        """
+        Candles of every CANDLES_PYRAMID level for the whole history of a market. Only the 1m level is aggregated by
+        SQLite, every other level is derived from a smaller one. The pyramid is kept and extended with the new ticks
+        when the database changes, so changing the interval or the time range is a slice of a ready frame.
+        """
+        market = (exchange, trading_pair)
+        fingerprint = get_db_fingerprint(self.db_name)
+        cached = self._candles_pyramids.get(market)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        if cached is not None and len(cached[1]["1m"]) > 0:
+            pyramid = self._extend_candles_pyramid(exchange, trading_pair, cached[1])
+        else:
+            pyramid = {}
+            for level, (interval, source_level) in self.CANDLES_PYRAMID.items():
+                if source_level is None:
+                    pyramid[level] = self.get_market_data_ohlc(exchange, trading_pair, interval)
+                else:
+                    pyramid[level] = self._resample_candles(pyramid[source_level], interval)
+        self._candles_pyramids[market] = (fingerprint, pyramid)
+        return pyramid
+
+    def _read_tail(self, table_name, update_column=None, columns="all", categorical_columns=None, **filters):
+        """
+        Read the rows of table_name matching the filters that were inserted past the stored rowid high-water mark.
+        For tables whose rows are also updated in place, the rows whose update_column reached its own mark are read
+        too, and the high-water mark is a (rowid, update_column) pair. Returns the new rows and the new high-water mark.
+        """
+        state = self._tail_state.get(table_name)
+        high_water_mark = state["high_water_mark"] if state is not None else None
+        conditions, params = self._get_conditions(table_name, **filters)
+        if high_water_mark is not None and update_column is None:
+            conditions.append("rowid > :rowid_mark")
+            params["rowid_mark"] = high_water_mark
+        elif high_water_mark is not None:
+            # Inserts are caught by rowid whatever their timestamp, in place updates by the update column
+            conditions.append(f"(rowid > :rowid_mark OR {update_column} >= :update_mark)")
+            params["rowid_mark"], params["update_mark"] = high_water_mark
+        select_columns = self._get_select_columns(table_name, columns)
+        if select_columns != "*" and update_column is not None and \
+                f'"{update_column}"' not in select_columns.split(", "):
+            select_columns += f', "{update_column}"'
+        query = f"SELECT rowid AS tail_rowid, {select_columns} FROM '{table_name}'"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        query += " ORDER BY rowid"
+        # Each tail query has a new high-water mark, caching them would only evict useful entries
+        new_rows = self._read_sql(query, params, use_cache=False, categorical_columns=categorical_columns)
+        if len(new_rows) > 0:
+            rowid_mark = new_rows["tail_rowid"].max().item()
+            if update_column is None:
+                high_water_mark = rowid_mark
+            elif high_water_mark is None:
+                high_water_mark = (rowid_mark, new_rows[update_column].max().item())
+            else:
+                # Updated rows can be older than the inserted ones and inserted rows stamped in the past, the marks
+                # never move back
+                high_water_mark = (max(rowid_mark, high_water_mark[0]),
+                                   max(new_rows[update_column].max().item(), high_water_mark[1]))
+        new_rows.drop(columns="tail_rowid", inplace=True)
+        return new_rows, high_water_mark
+
+    def get_orders_tail(self, compact=False, float32=False, **filters):
+        # Orders are updated in place when their status changes, so updates are tracked by last update time as well as
+        # inserts by rowid, and upserted by id
+        new_orders, high_water_mark = self._read_tail("Order", "last_update_timestamp",
+                                                      categorical_columns=self._get_categorical_columns("orders",
+                                                                                                        compact),
+                                                      **filters)
+        state = self._tail_state.get("Order")
+        if len(new_orders) == 0 and state is not None:
+            return state["data"]
+        new_orders = self._compact_table(self._process_orders(new_orders), "orders", compact, float32)
+        if state is not None:
+            previous_orders = state["data"]
+            new_orders = concat_tables([previous_orders[~previous_orders["id"].isin(new_orders["id"])], new_orders],
+                                       ignore_index=True)
+        self._tail_state["Order"] = {"data": new_orders, "high_water_mark": high_water_mark}
+        return new_orders
+
+    @staticmethod
+    def _get_last_fills(trade_fills, groupers):
+        """
+        Latest fill of each group by timestamp, which is the one the cumulative pnl columns end on. The rowid order
+        can differ when fills are written out of order.
+        """
+        order, _, ends = get_fill_segments(trade_fills, groupers)
+        return trade_fills.iloc[order[ends - 1]]
+
+    def get_trade_fills_tail(self, compact=False, float32=False, **filters):
+        groupers = ["config_file_path", "market", "symbol"]
+        new_fills, high_water_mark = self._read_tail("TradeFill",
+                                                     categorical_columns=self._get_categorical_columns("trade_fill",
+                                                                                                       compact),
+                                                     **filters)
+        state = self._tail_state.get("TradeFill")
+        if len(new_fills) == 0 and state is not None:
+            return state["data"]
+        if state is not None:
+            new_fills = self._compact_table(self._process_trade_fills(new_fills, last_fills=state["last_fills"]),
+                                            "trade_fill", compact, float32)
+            trade_fills = concat_tables([state["data"], new_fills], ignore_index=True)
+            last_fills = concat_tables([state["last_fills"], self._get_last_fills(new_fills, groupers)])
+        else:
+            trade_fills = self._compact_table(self._process_trade_fills(new_fills), "trade_fill", compact, float32)
+            last_fills = trade_fills
+        last_fills = self._get_last_fills(last_fills, groupers).reset_index(drop=True)
+        self._tail_state["TradeFill"] = {"data": trade_fills, "high_water_mark": high_water_mark,
+                                         "last_fills": last_fills}
+        return trade_fills
+
+    def _get_append_only_tail(self, table_name, strategy_table_name, process=None, compact=False, float32=False,
+                              **filters):
+        new_rows, high_water_mark = self._read_tail(
+            table_name, categorical_columns=self._get_categorical_columns(strategy_table_name, compact),
+            **filters)
+        state = self._tail_state.get(table_name)
+        if len(new_rows) == 0 and state is not None:
+            return state["data"]
+        if process is not None:
+            new_rows = process(new_rows)
+        new_rows = self._compact_table(new_rows, strategy_table_name, compact, float32)
+        data = concat_tables([state["data"], new_rows]) if state is not None else new_rows
+        self._tail_state[table_name] = {"data": data, "high_water_mark": high_water_mark}
+        return data
+
+    def get_order_status_tail(self, **filters):
+        return self._get_append_only_tail("OrderStatus", "order_status", **filters)
+
+    def get_market_data_tail(self, **filters):
+        return self._get_append_only_tail("MarketData", "market_data", self._process_market_data, **filters)
+
+    def get_position_executor_data_tail(self, **filters):
+        return self._get_append_only_tail("PositionExecutors", "position_executor",
+                                          self._process_position_executor_data, **filters)
@@ -0,0 +1,57 @@
+import os
+import threading
+from urllib.parse import quote
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+# Applied to every read-only connection. query_only guarantees the dashboard never takes the write lock of a database
+# that a bot is writing to, mmap_size and cache_size make repeated reads of large files cheap.
+READ_ONLY_PRAGMAS = {
+    "query_only": "ON",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # Negative values are KiB
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _create_sqlite_engine(db_path: str, read_only: bool) -> Engine:
+    if read_only:
+        # URI mode opens the file without creating it and without asking for write access
+        engine = create_engine(f"sqlite:///file:{quote(db_path)}?mode=ro&uri=true",
+                               connect_args={"check_same_thread": False})
+
+        @event.listens_for(engine, "connect")
+        def set_read_only_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma, value in READ_ONLY_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {pragma} = {value}")
+            cursor.close()
+    else:
+        engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False, "timeout": 0})
+    return engine
+
+
+def get_engine(db_path: str, read_only: bool = True) -> Engine:
+    """
+    Return the process-wide engine of a SQLite database, creating it on first use. Engines and their connection pools
+    are shared by every manager, Streamlit rerun and session that opens the same file.
+    """
+    key = (os.path.abspath(db_path), read_only)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _create_sqlite_engine(key[0], read_only)
+            _engines[key] = engine
+    return engine
+
+
+def dispose_engine(db_path: str):
+    """Close the pooled connections of a database, for example before the file is removed."""
+    with _engines_lock:
+        for read_only in [True, False]:
+            engine = _engines.pop((os.path.abspath(db_path), read_only), None)
+            if engine is not None:
+                engine.dispose()
@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+import pandas as pd
+
+from utils.data_manipulation import StrategyData
+from utils.database_manager import DatabaseManager
+
+
+def _get_bot_trade_fills_summary(db_path: str, filters: dict):
+    try:
+        return DatabaseManager(db_path).get_trade_fills_summary(**filters)
+    except Exception:
+        return None
+
+
+def _get_bot_strategy_data(db_path: str, filters: dict):
+    return DatabaseManager(db_path).get_strategy_data(**filters)
+
+
+class FederatedDatabaseManager:
+    """
+    Run the DatabaseManager queries over every bot database returned by os_utils.get_databases, each database in its
+    own worker process, and combine the results with a bot column ("<source>/<database>").
+    """
+    def __init__(self, databases: Dict[str, Dict[str, str]], max_workers: Optional[int] = None):
+        self.db_paths = {f"{source_name}/{db_name}": db_path
+                         for source_name, source_databases in (databases or {}).items()
+                         for db_name, db_path in source_databases.items()}
+        self.max_workers = max_workers or min(len(self.db_paths), os.cpu_count() or 1) or 1
+
+    def _map(self, worker, filters):
+        # Workers are started from a forkserver rather than forked from the multithreaded Streamlit server
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        with ProcessPoolExecutor(max_workers=self.max_workers,
+                                 mp_context=multiprocessing.get_context(start_method)) as executor:
+            futures = {bot: executor.submit(worker, db_path, filters) for bot, db_path in self.db_paths.items()}
+            return {bot: future.result() for bot, future in futures.items()}
+
+    def get_fleet_summary(self, config_file_path=None, start_date=None, end_date=None, exchange=None,
+                          trading_pair=None):
+        """
+        Trades, volume, fees and net realized pnl per bot and market. Each bot aggregates its own fills inside SQLite,
+        so only one row per market crosses the process boundary.
+        """
+        filters = dict(config_file_path=config_file_path, start_date=start_date, end_date=end_date,
+                       exchange=exchange, trading_pair=trading_pair)
+        summaries = [summary.assign(bot=bot) for bot, summary in self._map(_get_bot_trade_fills_summary, filters).items()
+                     if summary is not None]
+        if len(summaries) == 0:
+            return pd.DataFrame()
+        fleet_summary = pd.concat(summaries, ignore_index=True)
+        return fleet_summary[["bot"] + [column for column in fleet_summary.columns if column != "bot"]]
+
+    def get_strategy_data(self, config_file_path=None, start_date=None, end_date=None, exchange=None,
+                          trading_pair=None):
+        """
+        Load the tables of every bot and concatenate them in one StrategyData with a bot column. This moves the raw
+        rows of the whole fleet into this process, use get_fleet_summary for fleet level views.
+        """
+        filters = dict(config_file_path=config_file_path, start_date=start_date, end_date=end_date,
+                       exchange=exchange, trading_pair=trading_pair)
+        bots_strategy_data = self._map(_get_bot_strategy_data, filters)
+
+        def combine(table_name):
+            tables = [getattr(strategy_data, table_name).assign(bot=bot)
+                      for bot, strategy_data in bots_strategy_data.items()
+                      if getattr(strategy_data, table_name) is not None]
+            if len(tables) == 0:
+                return None
+            # market_data and position_executor are indexed by timestamp, the other tables have a plain range index
+            return pd.concat(tables, ignore_index=isinstance(tables[0].index, pd.RangeIndex))
+
+        return StrategyData(orders=combine("orders"),
+                            order_status=combine("order_status"),
+                            trade_fill=combine("trade_fill"),
+                            market_data=combine("market_data"),
+                            position_executor=combine("position_executor"))
@@ -236,7 +236,9 @@ class CandlesGraph:
         self.base_figure.update_yaxes(title_text='PNL', row=row, col=1)
 
     def add_positions(self, position_executor_data: pd.DataFrame, row=1):
-        position_executor_data["close_datetime"] = pd.to_datetime(position_executor_data["close_timestamp"], unit="s")
+        # Assigned on a new frame, position_executor_data can be a view of the strategy data
+        position_executor_data = position_executor_data.assign(
+            close_datetime=pd.to_datetime(position_executor_data["close_timestamp"], unit="s"))
         i = 1
         for index, rown in position_executor_data.iterrows():
             i += 1
@@ -454,6 +456,46 @@ class PerformanceGraphs:
             paper_bgcolor='rgba(0,0,0,0)')
         return fig
 
+    def equity_curve(self, interval: str = None):
+        equity_curve = self.strategy_data.get_equity_curve(interval)
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(name="Total PnL", x=equity_curve.index, y=equity_curve["total_pnl"],
+                                 line=dict(color="rgba(255, 255, 255, 0.9)")))
+        fig.add_trace(go.Scatter(name="Realized PnL", x=equity_curve.index, y=equity_curve["realized_pnl"],
+                                 line=dict(color=BULLISH_COLOR)))
+        fig.add_trace(go.Scatter(name="Unrealized PnL", x=equity_curve.index, y=equity_curve["unrealized_pnl"],
+                                 line=dict(color=BEARISH_COLOR)))
+        fig.update_layout(title=dict(
+            text='Mark-to-market PnL',
+            x=0.43,
+            y=0.95,
+        ),
+            yaxis_title=f"PnL ({self.strategy_data.quote_asset})",
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)')
+        return fig
+
+    def markouts(self, horizons=None, by="trade_type"):
+        markouts_summary = self.strategy_data.get_markouts_summary(horizons, by)
+        markout_columns = [column for column in markouts_summary.columns if column.startswith("markout_")]
+        fig = go.Figure()
+        for _, row in markouts_summary.iterrows():
+            fig.add_trace(go.Scatter(name=f"{row[by]} ({row['fills']} fills)",
+                                     x=[column.replace("markout_", "") for column in markout_columns],
+                                     y=row[markout_columns],
+                                     mode="lines+markers"))
+        fig.add_hline(y=0, line_dash="dot", line_color="gray")
+        fig.update_layout(title=dict(
+            text='Average markout after the fill',
+            x=0.43,
+            y=0.95,
+        ),
+            xaxis_title="Horizon",
+            yaxis_title="Markout (bps)",
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)')
+        return fig
+
     def intraday_performance(self):
         df = self.strategy_data.trade_fill.copy()
 
@@ -547,7 +589,7 @@ class PerformanceGraphs:
     def position_executor_summary_sunburst(self):
         if self.strategy_data.position_executor is not None:
             df = self.strategy_data.position_executor.copy()
-            grouped_df = df.groupby(["trading_pair", "side", "close_type"]).size().reset_index(name="count")
+            grouped_df = df.groupby(["trading_pair", "side", "close_type"], observed=True).size().reset_index(name="count")
 
             fig = px.sunburst(grouped_df,
                               path=['trading_pair', 'side', 'close_type'],
@@ -3,10 +3,11 @@ import json
 from typing import Optional
 
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
 
 from utils.data_manipulation import StrategyData
+from utils.engine_registry import get_engine
 
 
 class OptunaDBManager:
@@ -14,7 +15,7 @@ class OptunaDBManager:
         db_root_path = db_root_path or "data/backtesting"
         self.db_name = db_name
         self.db_path = f'sqlite:///{os.path.join(db_root_path, db_name)}'
-        self.engine = create_engine(self.db_path, connect_args={'check_same_thread': False})
+        self.engine = get_engine(os.path.join(db_root_path, db_name), read_only=True)
         self.session_maker = sessionmaker(bind=self.engine)
 
     @property
@@ -11,6 +11,8 @@ import yaml
 from hummingbot.smart_components.strategy_frameworks.market_making import MarketMakingControllerBase, \
     MarketMakingControllerConfigBase
 
+from utils.engine_registry import dispose_engine
+
 
 def remove_files_from_directory(directory: str):
     for file in os.listdir(directory):
@@ -18,6 +20,8 @@ def remove_files_from_directory(directory: str):
 
 
 def remove_file(file_path: str):
+    if file_path.endswith(".sqlite"):
+        dispose_engine(file_path)
     os.remove(file_path)
 
 
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+# Realized pnl conventions of the trade fills. mark_to_fill is the one computed by DatabaseManager: cash flow plus
+# inventory marked at the price of the last fill.
+PNL_METHODS = {
+    "mark_to_fill": "Mark to last fill",
+    "fifo": "FIFO",
+    "average_cost": "Average cost",
+}
+
+
+def get_fill_segments(trade_fill: pd.DataFrame, groupers):
+    """
+    Time order of the fills of each group: the row positions sorted by group and timestamp, timestamp ties keeping
+    the row order, and the start and end of every group in them. Every per group pass over the fills uses it, so
+    they all agree on which fill comes last.
+    """
+    group_codes = trade_fill.groupby(groupers, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+    order = np.lexsort((trade_fill["timestamp"].to_numpy(), group_codes))
+    if len(order) == 0:
+        return order, order, order
+    sorted_codes = group_codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    return order, starts, ends
+
+
+def _get_fifo_realized_pnl(signed_amounts, prices):
+    """
+    Realized pnl of each fill matching it against the open lots in first in, first out order. The lots are kept in
+    two preallocated lists used as a queue, every lot is opened and closed once so the whole pass is O(n).
+    Returns the realized pnl and whether the fill closed any amount.
+    """
+    n = len(signed_amounts)
+    lot_amounts = [0.0] * n
+    lot_prices = [0.0] * n
+    head = tail = 0
+    realized_pnl = [0.0] * n
+    closes = [False] * n
+    for i in range(n):
+        remaining = signed_amounts[i]
+        price = prices[i]
+        pnl = 0.0
+        # Only lots of the opposite side can be closed, the open lots always have the same side
+        while remaining != 0 and head < tail and (lot_amounts[head] > 0) != (remaining > 0):
+            lot_amount = lot_amounts[head]
+            matched = min(abs(remaining), abs(lot_amount))
+            if lot_amount > 0:
+                pnl += matched * (price - lot_prices[head])
+                lot_amount -= matched
+                remaining += matched
+            else:
+                pnl += matched * (lot_prices[head] - price)
+                lot_amount += matched
+                remaining -= matched
+            if abs(lot_amount) <= 1e-12 * matched:
+                head += 1
+            else:
+                lot_amounts[head] = lot_amount
+            if abs(remaining) <= 1e-12 * matched:
+                remaining = 0
+            closes[i] = True
+        if remaining != 0:
+            lot_amounts[tail] = remaining
+            lot_prices[tail] = price
+            tail += 1
+        realized_pnl[i] = pnl
+    return realized_pnl, closes
+
+
+def _get_average_cost_realized_pnl(signed_amounts, prices):
+    """
+    Realized pnl of each fill against the average entry price of the open position. Returns the realized pnl and
+    whether the fill closed any amount.
+    """
+    n = len(signed_amounts)
+    position = 0.0
+    average_price = 0.0
+    realized_pnl = [0.0] * n
+    closes = [False] * n
+    for i in range(n):
+        amount = signed_amounts[i]
+        price = prices[i]
+        if amount == 0:
+            continue
+        if position == 0 or (position > 0) == (amount > 0):
+            new_position = position + amount
+            average_price = (average_price * abs(position) + price * abs(amount)) / abs(new_position)
+            position = new_position
+            continue
+        closed = min(abs(amount), abs(position))
+        realized_pnl[i] = closed * (price - average_price) if position > 0 else closed * (average_price - price)
+        closes[i] = True
+        if abs(amount) > abs(position):
+            # The fill flips the position, the rest opens a new one at the fill price
+            average_price = price
+        position += amount
+        if abs(position) <= 1e-12 * closed:
+            position = 0.0
+            average_price = 0.0
+    return realized_pnl, closes
+
+
+def apply_pnl_method(trade_fill: pd.DataFrame, pnl_method: str):
+    """
+    Copy of processed trade fills with gross_pnl, realized_pnl, realized_trade_pnl and net_realized_pnl computed
+    with the given PNL_METHODS convention. Each config/market/symbol is matched on its own, in time order.
+    gross_pnl and realized_pnl are NaN for the fills that only open inventory, their fees still count in
+    net_realized_pnl.
+    """
+    if pnl_method == "mark_to_fill":
+        return trade_fill
+    engines = {"fifo": _get_fifo_realized_pnl, "average_cost": _get_average_cost_realized_pnl}
+    if pnl_method not in engines:
+        raise ValueError(f"Unknown pnl method {pnl_method}, use one of {list(PNL_METHODS)}")
+    trade_fill = trade_fill.copy()
+    if len(trade_fill) == 0:
+        return trade_fill
+
+    order, starts, ends = get_fill_segments(trade_fill, ["config_file_path", "market", "symbol"])
+    signed_amounts = (trade_fill["amount"].to_numpy(dtype=float) *
+                      np.where((trade_fill["trade_type"] == "BUY").to_numpy(), 1, -1))[order]
+    prices = trade_fill["price"].to_numpy(dtype=float)[order]
+
+    gross_pnl = np.empty(len(order))
+    closes = np.empty(len(order), dtype=bool)
+    for start, end in zip(starts, ends):
+        group_pnl, group_closes = engines[pnl_method](signed_amounts[start:end].tolist(), prices[start:end].tolist())
+        gross_pnl[start:end] = group_pnl
+        closes[start:end] = group_closes
+    realized_trade_pnl = gross_pnl.copy()
+    for start, end in zip(starts, ends):
+        np.cumsum(realized_trade_pnl[start:end], out=realized_trade_pnl[start:end])
+
+    # Back to the row order of trade_fill
+    unsorted = np.empty((len(order), 3))
+    unsorted[order] = np.column_stack([gross_pnl, realized_trade_pnl, closes])
+    gross_pnl, realized_trade_pnl, closes = unsorted[:, 0], unsorted[:, 1], unsorted[:, 2].astype(bool)
+    trade_fill["gross_pnl"] = np.where(closes, gross_pnl, np.nan)
+    trade_fill["realized_pnl"] = trade_fill["gross_pnl"] - trade_fill["trade_fee_in_quote"]
+    trade_fill["realized_trade_pnl"] = realized_trade_pnl
+    trade_fill["net_realized_pnl"] = realized_trade_pnl - trade_fill["cum_fees_in_quote"].to_numpy(dtype=float)
+    return trade_fill
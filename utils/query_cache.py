@@ -0,0 +1,81 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def get_db_fingerprint(db_path: str):
+    """
+    Size and mtime of a SQLite database and of its WAL file. Every commit of a writer changes one of them, so it is
+    a cheap way to know if the data changed. PRAGMA data_version is not used because its value is only comparable
+    within one connection, and the pooled connections of an engine are not pinned to a cache entry.
+    """
+    fingerprint = []
+    for path in [db_path, f"{db_path}-wal"]:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            fingerprint.append(f"{stat.st_size}-{stat.st_mtime_ns}")
+    return "_".join(fingerprint)
+
+
+class QueryCache:
+    """
+    LRU cache of query results shared by every DatabaseManager of the process, bounded by the memory used by the
+    cached frames. Entries are keyed by database, normalized SQL and bound parameters, and dropped as soon as the
+    database fingerprint changes so a live bot's commits are seen on the next query.
+    """
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_key(db_path: str, query: str, params: dict = None, variant=None):
+        normalized_query = " ".join(query.split())
+        normalized_params = tuple(sorted((key, str(value)) for key, value in (params or {}).items()))
+        return os.path.abspath(db_path), normalized_query, normalized_params, variant
+
+    def get_or_query(self, db_path: str, query: str, params: dict, run_query, variant=None):
+        """
+        Return a copy of the cached result of the query, running run_query() on a miss. Copies are returned because
+        the loaders post-process their frames in place. variant tells apart the results of one query that run_query
+        returns with different dtypes.
+        """
+        key = self._get_key(db_path, query, params, variant)
+        fingerprint = get_db_fingerprint(key[0])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == fingerprint:
+                    self._entries.move_to_end(key)
+                    return entry[1].copy()
+                self._remove(key)
+        result = run_query()
+        self._add(key, fingerprint, result)
+        return result.copy()
+
+    def _add(self, key, fingerprint, result: pd.DataFrame):
+        size = int(result.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (fingerprint, result, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+QUERY_CACHE = QueryCache()
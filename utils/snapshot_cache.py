@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from utils.query_cache import get_db_fingerprint
+
+
+class SnapshotCache:
+    """
+    On-disk cache of the processed frames returned by the DatabaseManager loaders, stored as uncompressed Arrow IPC
+    (Feather v2) files so warm loads are a memory-mapped columnar read instead of decoding SQLite rows again.
+    Snapshots are keyed by the database path plus its size and mtime (and those of its WAL file), so any write to the
+    database invalidates them.
+    """
+    def __init__(self, cache_dir: str = "data/snapshots"):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def _hash(value: str):
+        return hashlib.sha1(value.encode()).hexdigest()[:16]
+
+    def _get_snapshot_dir(self, db_path: str):
+        return os.path.join(self.cache_dir, self._hash(os.path.abspath(db_path)))
+
+    def _get_snapshot_prefix(self, loader_name: str, loader_kwargs: dict):
+        return f"{loader_name}_{self._hash(json.dumps(loader_kwargs, sort_keys=True, default=str))}"
+
+    def get_or_load(self, db_path: str, loader_name: str, loader_kwargs: dict, load):
+        """
+        Return the snapshot of loader_name(**loader_kwargs) for the current state of the database, calling load() and
+        storing its result when there is no valid snapshot.
+        """
+        fingerprint = get_db_fingerprint(db_path)
+        snapshot_dir = self._get_snapshot_dir(db_path)
+        prefix = self._get_snapshot_prefix(loader_name, loader_kwargs)
+        snapshot_path = os.path.join(snapshot_dir, f"{prefix}_{self._hash(fingerprint)}.arrow")
+        if os.path.exists(snapshot_path):
+            try:
+                return feather.read_table(snapshot_path, memory_map=True).to_pandas()
+            except (pa.ArrowException, OSError):
+                pass  # Corrupted or concurrently removed snapshot, load it again
+        df = load()
+        self._write_snapshot(df, snapshot_dir, prefix, snapshot_path)
+        return df
+
+    @staticmethod
+    def _write_snapshot(df: pd.DataFrame, snapshot_dir: str, prefix: str, snapshot_path: str):
+        try:
+            os.makedirs(snapshot_dir, exist_ok=True)
+            # Written to a temporary file first so concurrent readers never see a partial snapshot
+            tmp_path = f"{snapshot_path}.{uuid.uuid4().hex}.tmp"
+            feather.write_feather(pa.Table.from_pandas(df), tmp_path, compression="uncompressed")
+            os.replace(tmp_path, snapshot_path)
+            for file_name in os.listdir(snapshot_dir):
+                stale_path = os.path.join(snapshot_dir, file_name)
+                if file_name.startswith(prefix) and file_name.endswith(".arrow") and stale_path != snapshot_path:
+                    os.remove(stale_path)
+        except (pa.ArrowException, OSError):
+            pass  # The cache is best effort, the frame was already loaded from the database
+
+    def clear(self, db_path: str = None):
+        snapshot_dir = self._get_snapshot_dir(db_path) if db_path else self.cache_dir
+        if os.path.exists(snapshot_dir):
+            for dirpath, _, file_names in os.walk(snapshot_dir):
+                for file_name in file_names:
+                    if file_name.endswith(".arrow"):
+                        os.remove(os.path.join(dirpath, file_name))